@@ -30,4 +30,9 @@ urlpatterns = [
         views.UserActivityCompletionView.as_view(),
         name='user-activity-completion-data',
     ),
+    url(
+        r'^user-activity-completion-data-async$',
+        views.UserActivityCompletionAsyncView.as_view(),
+        name='user-activity-completion-data-async',
+    ),
 ]
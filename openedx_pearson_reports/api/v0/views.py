@@ -4,6 +4,7 @@ This file contains the views for openedx-pearson-reports.
 import json
 import logging
 
+from celery import chord
 from celery.result import AsyncResult
 from django.conf import settings
 from django.http import JsonResponse, Http404
@@ -23,12 +24,11 @@ from openedx_pearson_reports.edxapp_wrapper.get_edx_rest_framework_extensions im
 from openedx_pearson_reports.edxapp_wrapper.get_student_account_library import (
     get_user_salesforce_contact_id,
 )
-from openedx_pearson_reports.reports.activity_completion_report import GenerateCompletionReport
+from openedx_pearson_reports.reports.activity_completion_report import get_users_activity_completion_data
 from openedx_pearson_reports.serializers import SalesforceContactIdSerializer, ActivityCompletionReportSerializer
 from openedx_pearson_reports.utils import (
     get_attribute_from_module,
     get_exisiting_users_by_email,
-    get_user_course_enrollments,
 )
 
 logger = logging.getLogger(__name__)
@@ -299,34 +299,16 @@ class UserActivityCompletionView(APIView):
                 }
             }
         """
-        completion_data = {}
         serialized_data = ActivityCompletionReportSerializer(data=request.data)
 
         serialized_data.is_valid(raise_exception=True)
 
-        user_list = get_exisiting_users_by_email(serialized_data.data.get('users', []))
-
-        for user in user_list:
-            user_course_keys = serialized_data.data.get('course_keys', []) or get_user_course_enrollments(user)
-            course_user_completion_data = {}
-
-            for course_key in user_course_keys:
-                activity_completion_data = GenerateCompletionReport.activity_completion_data_per_user(
-                    user=user,
-                    course_key=course_key,
-                    block_types=serialized_data.data.get('block_types', []),
-                    passing_score=serialized_data.data.get('passing_score', 0),
-                ).get_user_completion_data()
-
-                course_data = {
-                    str(course_key): activity_completion_data,
-                }
-
-                course_user_completion_data.update(course_data)
-
-            completion_data.update({
-                user.email: course_user_completion_data,
-            })
+        completion_data = get_users_activity_completion_data(
+            user_list=get_exisiting_users_by_email(serialized_data.data.get('users', []), include_profile=True),
+            course_keys=serialized_data.data.get('course_keys', []),
+            block_types=serialized_data.data.get('block_types', []),
+            passing_score=serialized_data.data.get('passing_score', 0),
+        )
 
         json_response = {
             'result': {
@@ -335,3 +317,68 @@ class UserActivityCompletionView(APIView):
         }
 
         return JsonResponse(json_response, status=status.HTTP_200_OK)
+
+
+class UserActivityCompletionAsyncView(APIView):
+    """
+    This class is intended to generate the activity completion data per user in background tasks.
+    """
+
+    authentication_classes = (get_jwt_authentication(), openedx_bearer_authentication())
+    permission_classes = (permissions.IsAuthenticated, permissions.IsAdminUser)
+
+    def post(self, request):
+        """
+        Start the tasks to get the activity completion data by user.
+
+        The users are split in chunks of OPR_USER_ACTIVITY_COMPLETION_CHUNK_SIZE users,
+        every chunk is processed by a task and the results are merged by a final task.
+
+        **Params**
+            The same params of the user-activity-completion-data API endpoint.
+        **Example Requests**:
+            POST /pearson-reports/pearson-reports/api/v0/user-activity-completion-data-async
+        **Response Values**:
+            * success: If the tasks have been started correctly.
+            * state_url: This url provides the status and result for the task.
+                         The result is the same response of the user-activity-completion-data API endpoint.
+            * message: Response message.
+        """
+        serialized_data = ActivityCompletionReportSerializer(data=request.data)
+
+        serialized_data.is_valid(raise_exception=True)
+
+        users = serialized_data.data.get('users', [])
+        chunk_size = getattr(settings, 'OPR_USER_ACTIVITY_COMPLETION_CHUNK_SIZE', 50)
+        chunk_task = get_attribute_from_module(SUPPORTED_TASKS_MODULE, 'generate_user_activity_completion_data_chunk')
+        merge_task = get_attribute_from_module(SUPPORTED_TASKS_MODULE, 'merge_user_activity_completion_data')
+        chunk_kwargs = {
+            'course_ids': serialized_data.data.get('course_ids', []),
+            'block_types': serialized_data.data.get('block_types', []),
+        }
+
+        if serialized_data.data.get('passing_score') is not None:
+            # Decimal values can not be serialized by the task broker.
+            chunk_kwargs['passing_score'] = str(serialized_data.data.get('passing_score'))
+
+        chunk_tasks = [
+            chunk_task.s(users=users[cursor_index:cursor_index + chunk_size], **chunk_kwargs)
+            for cursor_index in range(0, len(users), chunk_size)
+        ]
+
+        if chunk_tasks:
+            task = chord(chunk_tasks)(merge_task.s())
+        else:
+            task = merge_task.delay([])
+
+        state_url = request.build_absolute_uri(reverse('pearson-reports:api:v0:get-report-data'))
+
+        logger.info('The task with id = %s has been initialize.', task.id)
+
+        json_response = dict(
+            success=True,
+            state_url='{}?task_id={}'.format(state_url, task.id),
+            message='The task with id = {} has been initialize.'.format(task.id),
+        )
+
+        return JsonResponse(json_response, status=status.HTTP_202_ACCEPTED)
@@ -57,7 +57,11 @@ class GenerateReportView(APIView):
         if not report_backend:
             raise Http404
 
-        backend_instance = report_backend(report_settings=report_backend_settings, **serialized_data.data)
+        backend_instance = report_backend(
+            report_settings=report_backend_settings,
+            report_name=report_name,
+            **serialized_data.data
+        )
         backend_response = backend_instance.process_request(
             request=request,
             extra_data={key: value for key, value in request_data.items() if key not in serialized_data.data},
@@ -1,2 +1,7 @@
 """ Backend abstraction. """
-from completion.models import BlockCompletion  # pylint: disable=unused-import
+from completion.models import BlockCompletion
+
+
+def get_learning_context_completions_by_users_backend(users, context_key):
+    """ Real backend to get the BlockCompletion records of many users in a learning context. """
+    return BlockCompletion.objects.filter(user__in=users, context_key=context_key)
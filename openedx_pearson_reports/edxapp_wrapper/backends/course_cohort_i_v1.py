@@ -1,7 +1,34 @@
 """ Backend abstraction """
-from openedx.core.djangoapps.course_groups.cohorts import get_cohort
+from openedx.core.djangoapps.course_groups.cohorts import get_cohort, is_course_cohorted
+from openedx.core.djangoapps.course_groups.models import CourseUserGroup
 
 
 def get_course_cohort_backend(*args, **kwargs):
     """ Real backend to get course cohorts """
     return get_cohort(*args, **kwargs)
+
+
+def get_course_cohort_names_backend(course_key, users):
+    """
+    Real backend to get a {user_id: cohort_name} dict for the given users of the course.
+
+    Users without a cohort are resolved with get_cohort, so they are assigned
+    to a cohort in the same way the per user lookup does.
+    """
+    if not is_course_cohorted(course_key):
+        return {}
+
+    cohort_names = dict(
+        CourseUserGroup.objects.filter(
+            course_id=course_key,
+            group_type=CourseUserGroup.COHORT,
+            users__in=users,
+        ).values_list('users', 'name')
+    )
+
+    for user in users:
+        if user.id not in cohort_names:
+            cohort = get_cohort(user, course_key)
+            cohort_names[user.id] = cohort.name if cohort else ''
+
+    return cohort_names
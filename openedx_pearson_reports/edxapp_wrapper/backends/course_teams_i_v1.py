@@ -1,7 +1,21 @@
 """ Backend abstraction """
-from lms.djangoapps.teams.models import CourseTeam
+from lms.djangoapps.teams.models import CourseTeam, CourseTeamMembership
 
 
 def get_course_teams_backend(*args, **kwargs):
     """ Real backend to get course_teams """
     return CourseTeam.objects.filter(*args, **kwargs)
+
+
+def get_course_team_names_backend(course_key, users):
+    """ Real backend to get a {user_id: team_name} dict for the given users of the course. """
+    team_names = {}
+    memberships = CourseTeamMembership.objects.filter(
+        team__course_id=course_key,
+        user__in=users,
+    ).order_by('team__id').values_list('user_id', 'team__name')
+
+    for user_id, team_name in memberships:
+        team_names.setdefault(user_id, team_name)
+
+    return team_names
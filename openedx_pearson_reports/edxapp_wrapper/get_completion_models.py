@@ -10,3 +10,12 @@ def get_block_completion_model(*args, **kwargs):  # pylint: disable=unused-argum
     backend = import_module(backend_function)
 
     return backend.BlockCompletion
+
+
+def get_learning_context_completions_by_users(*args, **kwargs):
+    """ Get the BlockCompletion records of many users in a learning context. """
+
+    backend_function = settings.OPR_COMPLETION_MODELS
+    backend = import_module(backend_function)
+
+    return backend.get_learning_context_completions_by_users_backend(*args, **kwargs)
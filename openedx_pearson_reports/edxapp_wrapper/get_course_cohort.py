@@ -10,3 +10,12 @@ def get_course_cohort(*args, **kwargs):
     backend = import_module(backend_function)
 
     return backend.get_course_cohort_backend(*args, **kwargs)
+
+
+def get_course_cohort_names(*args, **kwargs):
+    """ Get the cohort names of many users in a course """
+
+    backend_function = settings.OPR_COURSE_COHORT
+    backend = import_module(backend_function)
+
+    return backend.get_course_cohort_names_backend(*args, **kwargs)
@@ -10,3 +10,12 @@ def get_course_teams(*args, **kwargs):
     backend = import_module(backend_function)
 
     return backend.get_course_teams_backend(*args, **kwargs)
+
+
+def get_course_team_names(*args, **kwargs):
+    """ Get the team names of many users in a course """
+
+    backend_function = settings.OPR_COURSE_TEAMS
+    backend = import_module(backend_function)
+
+    return backend.get_course_team_names_backend(*args, **kwargs)
@@ -1,7 +1,14 @@
 """
 This module contains some Google BigQuery API abstract functions.
 """
+import hashlib
+import json
 import logging
+import os
+import pickle
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from django.conf import settings
 from google.api_core.exceptions import GoogleAPIError
@@ -9,50 +16,415 @@ from google.cloud import bigquery
 from google.cloud.bigquery.client import Client
 from google.oauth2 import service_account
 
+from openedx_pearson_reports.google_services.sqlite_module import SQLiteAnalyticsClient
+from openedx_pearson_reports.utils import LRUCache, get_or_set_cache_single_flight
+
 BIGQUERY_API_SCOPES = (
     'https://www.googleapis.com/auth/bigquery',
     'https://www.googleapis.com/auth/cloud-platform',
     'https://www.googleapis.com/auth/bigquery.readonly',
 )
+BIGQUERY_CLIENTS = {}
+BIGQUERY_CLIENTS_LOCK = threading.Lock()
+BIGQUERY_RESULT_CACHE_KEY_PREFIX = 'openedx_pearson_reports.bigquery_result'
+BIGQUERY_RESULT_LOCAL_CACHE = LRUCache(
+    max_size=getattr(settings, 'OPR_GOOGLE_BIGQUERY_RESULT_LOCAL_CACHE_SIZE', 8),
+    timeout=getattr(settings, 'OPR_GOOGLE_BIGQUERY_RESULT_CACHE_TIMEOUT', 600),
+)
 CCX_CANONICAL_NAMESPACE = 'ccx-v1'
+SQLITE_ANALYTICS_BACKEND = 'sqlite'
 logger = logging.getLogger(__name__)
 
 
-def get_google_bigquery_data(query_string):
+def get_google_bigquery_data(query_string, page_size=None, raise_errors=False, query_parameters=None):
     """
     Return the Google BigQuery data.
 
+    The rows are fetched one page at a time while the result is iterated, so the
+    callers can aggregate them with bounded memory instead of building a list of all the rows.
+
+    Args:
+        query_string: The query string to run.
+        page_size: Number of rows fetched per API request. Defaults to OPR_GOOGLE_BIGQUERY_PAGE_SIZE.
+        raise_errors: If True, a failed query raises GoogleBigQueryQueryError instead of returning an empty list.
+        query_parameters: List of google.cloud.bigquery.ScalarQueryParameter instances. **Optional**
     Return:
-        google.cloud.bigquery.job.QueryJob.result() instance.
+        google.cloud.bigquery.table.RowIterator instance or an empty list if the query failed.
+    Raises:
+        GoogleBigQueryQueryError: If the query or its dry run failed and raise_errors is True.
+        GoogleBigQueryQueryCostError: If the dry run estimate exceeds OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES.
+    """
+    try:
+        query_job = submit_google_bigquery_job(
+            get_google_bigquery_api_client(),
+            query_string,
+            query_parameters,
+        )
+
+        return get_google_bigquery_job_result(query_job, page_size)
+    except GoogleBigQueryQueryError:
+        if raise_errors:
+            raise
+
+        return []
+
+
+def get_google_bigquery_data_per_key(queries, process_rows=list, page_size=None, query_weights=None):
+    """
+    Run many Google BigQuery queries at the same time.
+
+    All the jobs are submitted first and then their results are collected by a pool of up to
+    OPR_GOOGLE_BIGQUERY_MAX_CONCURRENT_JOBS threads, so the wall-clock time is close to the one of
+    the slowest query instead of the sum of all of them. A failed query, or a process_rows error,
+    is logged and does not affect the results of the other keys. A query with a weight greater than 1
+    that exceeds its cost limit is handled as a failed query, so the caller can split it.
+
+    Args:
+        queries: Dict {key: (query string, list of google.cloud.bigquery.ScalarQueryParameter instances)}.
+        process_rows: Callable that receives the RowIterator of a query and returns its result,
+                      e.g. to index the rows while they are fetched. Defaults to list.
+        page_size: Number of rows fetched per API request. Defaults to OPR_GOOGLE_BIGQUERY_PAGE_SIZE.
+        query_weights: Dict {key: number of queries joined in the query}, e.g. the courses of a batch query.
+                       The byte limits of the query are multiplied by its weight. Defaults to 1. **Optional**
+    Returns:
+        Dict {key: process_rows result} with the keys of the successful queries.
+    Raises:
+        GoogleBigQueryQueryCostError: If the dry run estimate of a query with a weight of 1 exceeds
+                                      OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES. The submitted jobs are cancelled.
     """
     bigquery_client = get_google_bigquery_api_client()
-    query_job = bigquery_client.query(
+    query_jobs = {}
+    results = {}
+    query_weights = query_weights or {}
+
+    for key, (query_string, query_parameters) in queries.items():
+        query_weight = query_weights.get(key, 1)
+
+        try:
+            query_jobs[key] = submit_google_bigquery_job(
+                bigquery_client,
+                query_string,
+                query_parameters,
+                query_weight,
+            )
+        except GoogleBigQueryQueryError:
+            continue
+        except GoogleBigQueryQueryCostError as cost_error:
+            if query_weight > 1:
+                logger.warning('Google BigQuery query of %s skipped: %s', key, str(cost_error))
+                continue
+
+            cancel_google_bigquery_jobs(query_jobs.values())
+            raise
+        except GoogleAPIError as api_error:
+            logger.error('Google BigQuery API error: %s', str(api_error))
+
+    if not query_jobs:
+        return results
+
+    def get_processed_result(query_job):
+        """
+        Fetch the rows of the job and return the process_rows result.
+        """
+        return process_rows(get_google_bigquery_job_result(query_job, page_size))
+
+    max_workers = min(len(query_jobs), getattr(settings, 'OPR_GOOGLE_BIGQUERY_MAX_CONCURRENT_JOBS', 8) or 1)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_keys = {
+            executor.submit(get_processed_result, query_job): key
+            for key, query_job in query_jobs.items()
+        }
+
+        for future in as_completed(future_keys):
+            try:
+                results[future_keys[future]] = future.result()
+            except GoogleBigQueryQueryError:
+                continue
+            except GoogleAPIError as api_error:
+                logger.error('Google BigQuery API error: %s', str(api_error))
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Google BigQuery result of %s could not be processed.', future_keys[future])
+
+    return results
+
+
+def submit_google_bigquery_job(bigquery_client, query_string, query_parameters=None, query_weight=1):
+    """
+    Start the Google BigQuery job of the given query.
+
+    If OPR_GOOGLE_BIGQUERY_DRY_RUN is set, the query is estimated with a dry run first and it is
+    not started when it would process more than OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES.
+
+    Args:
+        bigquery_client: google.cloud.bigquery.client.Client instance.
+        query_string: The query string to run.
+        query_parameters: List of google.cloud.bigquery.ScalarQueryParameter instances. **Optional**
+        query_weight: Number of queries joined in the query, the byte limits are multiplied by it. **Optional**
+    Return:
+        google.cloud.bigquery.job.QueryJob instance.
+    Raises:
+        GoogleBigQueryQueryError: If the dry run failed, e.g. the query is not valid.
+        GoogleBigQueryQueryCostError: If the dry run estimate exceeds OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES.
+    """
+    if getattr(settings, 'OPR_GOOGLE_BIGQUERY_DRY_RUN', False):
+        check_google_bigquery_query_cost(bigquery_client, query_string, query_parameters, query_weight)
+
+    return bigquery_client.query(
         query_string,
-        job_config=get_google_bigquery_job_config(),
+        job_config=get_google_bigquery_job_config(query_parameters, query_weight),
     )
 
+
+def cancel_google_bigquery_jobs(query_jobs):
+    """
+    Cancel the given query jobs, e.g. when the results of the other jobs can't be used.
+
+    Args:
+        query_jobs: Iterable of google.cloud.bigquery.job.QueryJob instances.
+    """
+    for query_job in query_jobs:
+        try:
+            query_job.cancel()
+        except GoogleAPIError as api_error:
+            logger.error('Google BigQuery job could not be cancelled: %s', str(api_error))
+
+
+def check_google_bigquery_query_cost(bigquery_client, query_string, query_parameters=None, query_weight=1):
+    """
+    Return the number of bytes the query would process, using a Google BigQuery dry run.
+
+    Args:
+        bigquery_client: google.cloud.bigquery.client.Client instance.
+        query_string: The query string to estimate.
+        query_parameters: List of google.cloud.bigquery.ScalarQueryParameter instances. **Optional**
+        query_weight: Number of queries joined in the query, the limit is multiplied by it. **Optional**
+    Return:
+        Number of bytes processed by the query.
+    Raises:
+        GoogleBigQueryQueryError: If the dry run failed, e.g. the query is not valid.
+        GoogleBigQueryQueryCostError: If the estimate exceeds OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES.
+    """
+    job_config = get_google_bigquery_job_config(query_parameters, query_weight)
+    job_config.dry_run = True
+    job_config.use_query_cache = False
+
+    try:
+        total_bytes_processed = bigquery_client.query(query_string, job_config=job_config).total_bytes_processed or 0
+    except GoogleAPIError as api_error:
+        logger.error('Google BigQuery dry run error: %s', str(api_error))
+        raise GoogleBigQueryQueryError(str(api_error))
+
+    max_process_bytes = get_google_bigquery_max_process_bytes(query_weight)
+    logger.info('Google BigQuery query estimate: %s bytes processed.', total_bytes_processed)
+
+    if max_process_bytes and total_bytes_processed > max_process_bytes:
+        raise GoogleBigQueryQueryCostError(
+            'The query would process {} bytes, which exceeds the limit of {} bytes.'.format(
+                total_bytes_processed,
+                max_process_bytes,
+            ),
+        )
+
+    return total_bytes_processed
+
+
+def get_google_bigquery_job_result(query_job, page_size=None):
+    """
+    Wait for the given query job and return its result.
+
+    Args:
+        query_job: google.cloud.bigquery.job.QueryJob instance.
+        page_size: Number of rows fetched per API request. Defaults to OPR_GOOGLE_BIGQUERY_PAGE_SIZE.
+    Return:
+        google.cloud.bigquery.table.RowIterator instance.
+    Raises:
+        GoogleBigQueryQueryError: If the query failed.
+    """
     try:
         query_job.exception()
     except GoogleAPIError as api_error:
         for error_item in api_error.errors:
             logger.error('Google BigQuery API error: %s', error_item.get('message', ''))
-            return []
+
+        raise GoogleBigQueryQueryError(str(api_error))
 
     if query_job.errors:
         for error_item in query_job.errors:
             logger.error('Google BigQuery query error: %s', error_item.get('message', ''))
-            return []
 
-    return query_job.result()
+        raise GoogleBigQueryQueryError(str(query_job.errors))
+
+    return query_job.result(
+        page_size=page_size or getattr(settings, 'OPR_GOOGLE_BIGQUERY_PAGE_SIZE', None),
+    )
+
+
+def get_cached_google_bigquery_data(query_string, query_parameters=None, process_rows=None):
+    """
+    Return the Google BigQuery data, cached in the Django cache for OPR_GOOGLE_BIGQUERY_RESULT_CACHE_TIMEOUT seconds.
+
+    The result is stored zlib compressed under a hash of the normalized query, its parameters and process_rows,
+    so the tasks running the same query, e.g. the pages of a report, make a single Google BigQuery job.
+    While a task runs the query, the other tasks wait for its result. The failed queries are not cached.
+    The last results are also kept decompressed in the worker process, so the next tasks of the
+    same worker read them without the Django cache. The compressed results bigger than
+    OPR_GOOGLE_BIGQUERY_RESULT_CACHE_MAX_BYTES are not stored in the Django cache, only in the worker process.
+    This cache is independent from OPR_GOOGLE_BIGQUERY_USE_CACHE, which only controls the Google BigQuery
+    server side cache.
+
+    Args:
+        query_string: The query string to run.
+        query_parameters: List of google.cloud.bigquery.ScalarQueryParameter instances. **Optional**
+        process_rows: Module level function that receives the rows and returns the value to cache,
+                      e.g. a compact mapping of the rows. By default, the rows are cached as a list of dicts.
+    Return:
+        process_rows result for the rows, or for an empty list if the query failed.
+    Raises:
+        GoogleBigQueryQueryCostError: If the dry run estimate exceeds OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES.
+    """
+    cache_timeout = getattr(settings, 'OPR_GOOGLE_BIGQUERY_RESULT_CACHE_TIMEOUT', 0)
+    process_rows = process_rows or get_rows_as_dicts
+
+    def get_compressed_result():
+        result = process_rows(
+            get_google_bigquery_data(query_string, query_parameters=query_parameters, raise_errors=True),
+        )
+
+        return zlib.compress(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+
+    if not cache_timeout:
+        return process_rows(get_google_bigquery_data(query_string, query_parameters=query_parameters))
+
+    cache_key = get_google_bigquery_result_cache_key(
+        query_string,
+        query_parameters,
+        '{}.{}'.format(process_rows.__module__, process_rows.__name__),
+    )
+    result = BIGQUERY_RESULT_LOCAL_CACHE.get(cache_key)
+
+    if result is not None:
+        return result
+
+    try:
+        compressed_result = get_or_set_cache_single_flight(
+            cache_key=cache_key,
+            get_value=get_compressed_result,
+            timeout=cache_timeout,
+            lock_timeout=getattr(settings, 'OPR_GOOGLE_BIGQUERY_RESULT_CACHE_LOCK_TIMEOUT', 300),
+            max_size=getattr(settings, 'OPR_GOOGLE_BIGQUERY_RESULT_CACHE_MAX_BYTES', None),
+        )
+    except GoogleBigQueryQueryError:
+        return process_rows([])
+
+    result = pickle.loads(zlib.decompress(compressed_result))
+    BIGQUERY_RESULT_LOCAL_CACHE.set(cache_key, result)
+
+    return result
+
+
+def get_rows_as_dicts(bigquery_data):
+    """
+    Return the Google BigQuery rows as a list of dicts.
+    """
+    return [dict(row.items()) for row in bigquery_data]
+
+
+def get_google_bigquery_result_cache_key(query_string, query_parameters=None, result_name=''):
+    """
+    Return the Django cache key of the result of a Google BigQuery query.
+
+    The whitespaces of the query are normalized, so the same query built with a different
+    indentation or line breaks uses the same key.
+
+    Args:
+        query_string: The query string.
+        query_parameters: List of google.cloud.bigquery.ScalarQueryParameter instances. **Optional**
+        result_name: Name of the value built from the rows. **Optional**
+    Returns:
+        Cache key string.
+    """
+    query_hash = hashlib.md5(' '.join(query_string.split()).encode('utf-8'))
+    query_hash.update(
+        json.dumps(
+            [query_parameter.to_api_repr() for query_parameter in query_parameters or []],
+            sort_keys=True,
+            default=str,
+        ).encode('utf-8'),
+    )
+
+    query_hash.update(result_name.encode('utf-8'))
+
+    return '{}.{}'.format(BIGQUERY_RESULT_CACHE_KEY_PREFIX, query_hash.hexdigest())
+
+
+def get_google_bigquery_limit_clause():
+    """
+    Return the LIMIT clause for the Google BigQuery queries.
+
+    The results are not limited unless OPR_GOOGLE_BIGQUERY_MAX_NUMBER_RESULTS_PER_QUERY is set.
+
+    Returns:
+        LIMIT clause string or an empty string.
+    """
+    query_max_result_number = getattr(settings, 'OPR_GOOGLE_BIGQUERY_MAX_NUMBER_RESULTS_PER_QUERY', None)
+
+    if not query_max_result_number:
+        return ''
+
+    return 'LIMIT {}'.format(int(query_max_result_number))
 
 
 def get_google_bigquery_api_client():
     """
-    Return the Google BigQuery API client.
+    Return the Google BigQuery API client of the current process.
+
+    The client is created lazily and shared by all the calls of the process, so its authorized
+    session, access token and connections are reused until the token expires and is refreshed.
+    The clients are stored by process id, so a Celery prefork child never uses the client
+    of its parent process and creates its own after the fork.
 
     Returns:
         google_bigquery_client: google.cloud.bigquery.client.Client instance.
     """
+    process_id = os.getpid()
+    google_bigquery_client = BIGQUERY_CLIENTS.get(process_id)
+
+    if google_bigquery_client is None:
+        with BIGQUERY_CLIENTS_LOCK:
+            google_bigquery_client = BIGQUERY_CLIENTS.get(process_id)
+
+            if google_bigquery_client is None:
+                google_bigquery_client = create_google_bigquery_api_client()
+                BIGQUERY_CLIENTS.clear()
+                BIGQUERY_CLIENTS[process_id] = google_bigquery_client
+
+    return google_bigquery_client
+
+
+def create_google_bigquery_api_client():
+    """
+    Return a new Google BigQuery API client.
+
+    If OPR_ANALYTICS_BACKEND is 'sqlite', the client runs the queries in the local
+    OPR_ANALYTICS_SQLITE_DATABASE_PATH database instead of Google BigQuery.
+
+    Returns:
+        google_bigquery_client: google.cloud.bigquery.client.Client or SQLiteAnalyticsClient instance.
+    Raises:
+        GoogleBigQueryInformationError: If the credentials, the project ID or the SQLite database path
+                                        were not provided.
+    """
+    if getattr(settings, 'OPR_ANALYTICS_BACKEND', '') == SQLITE_ANALYTICS_BACKEND:
+        sqlite_database_path = getattr(settings, 'OPR_ANALYTICS_SQLITE_DATABASE_PATH', '')
+
+        # An empty path opens a new temporary database, where every query would fail silently.
+        if not sqlite_database_path:
+            logger.error('OPR_ANALYTICS_SQLITE_DATABASE_PATH was not provided.')
+            raise GoogleBigQueryInformationError('OPR_ANALYTICS_SQLITE_DATABASE_PATH was not provided.')
+
+        return SQLiteAnalyticsClient(sqlite_database_path)
+
     service_account_credentials = getattr(settings, 'OPR_GOOGLE_SERVICE_ACCOUNT_CREDENTIALS', {})
     google_project_id = getattr(settings, 'OPR_GOOGLE_CLOUD_PROJECT_ID', '')
 
@@ -71,17 +443,43 @@ def get_google_bigquery_api_client():
     )
 
 
-def get_google_bigquery_job_config():
+def get_google_bigquery_max_process_bytes(query_weight=1):
+    """
+    Return the maximum number of bytes a query can process.
+
+    Google BigQuery bills at least 10MB per table referenced by a query, so the limit of
+    OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES applies to each of the queries joined in the query.
+
+    Args:
+        query_weight: Number of queries joined in the query. **Optional**
+    Returns:
+        Number of bytes or None if the queries are not limited.
+    """
+    max_process_bytes = getattr(settings, 'OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES', None)
+
+    if not max_process_bytes:
+        return None
+
+    return max_process_bytes * max(query_weight, 1)
+
+
+def get_google_bigquery_job_config(query_parameters=None, query_weight=1):
     """
     Return the Google BigQuery job configuration.
 
+    Args:
+        query_parameters: List of google.cloud.bigquery.ScalarQueryParameter instances. **Optional**
+        query_weight: Number of queries joined in the query, the byte limit is multiplied by it. **Optional**
     Returns:
         job_config: google.cloud.bigquery.job.QueryJobConfig instance.
     """
     job_config = bigquery.QueryJobConfig()
-    job_config.maximum_bytes_billed = getattr(settings, 'OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES', None)
+    job_config.maximum_bytes_billed = get_google_bigquery_max_process_bytes(query_weight)
     job_config.use_query_cache = getattr(settings, 'OPR_GOOGLE_BIGQUERY_USE_CACHE', False)
 
+    if query_parameters:
+        job_config.query_parameters = query_parameters
+
     return job_config
 
 
@@ -145,3 +543,18 @@ class GoogleBigQueryInformationError(Exception):
     by Google BigQuery were not provided.
     """
     pass
+
+
+class GoogleBigQueryQueryError(Exception):
+    """
+    Exception class raised when a Google BigQuery query failed.
+    """
+    pass
+
+
+class GoogleBigQueryQueryCostError(Exception):
+    """
+    Exception class raised when a Google BigQuery query would process more
+    bytes than OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES.
+    """
+    pass
@@ -0,0 +1,209 @@
+"""
+This module contains a local SQLite stand-in of the Google BigQuery time_on_asset_daily table.
+
+It is used when OPR_ANALYTICS_BACKEND is 'sqlite', so the time spent reports can be profiled
+without Google BigQuery. The client and job classes implement the subset of the Google BigQuery
+client API used by bigquery_module.
+"""
+import logging
+import re
+import sqlite3
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+TIME_ON_ASSET_DAILY_TABLE_NAME = 'time_on_asset_daily'
+TIME_ON_ASSET_DAILY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS time_on_asset_daily (
+        date TEXT NOT NULL,
+        course_id TEXT NOT NULL,
+        username TEXT NOT NULL,
+        module_id TEXT NOT NULL,
+        time_umid5 REAL,
+        time_umid30 REAL
+    )
+"""
+TIME_ON_ASSET_DAILY_INDEX = """
+    CREATE INDEX IF NOT EXISTS time_on_asset_daily_course_date
+    ON time_on_asset_daily (course_id, date)
+"""
+# Every course dataset of Google BigQuery is stored in the same local table, the rows have the course_id column.
+TABLE_PATH_REGEX = re.compile(r'`[^`]*\.{}`'.format(TIME_ON_ASSET_DAILY_TABLE_NAME))
+
+
+class SQLiteAnalyticsClient(object):
+    """
+    Local client with the query method of google.cloud.bigquery.client.Client.
+    """
+
+    def __init__(self, database_path):
+        self.database_path = database_path
+
+    def query(self, query_string, job_config=None):
+        """
+        Run the query in the local database.
+
+        Args:
+            query_string: Google BigQuery standard SQL query string.
+            job_config: google.cloud.bigquery.job.QueryJobConfig instance. **Optional**
+        Returns:
+            SQLiteQueryJob instance.
+        """
+        query_parameters = getattr(job_config, 'query_parameters', None) or []
+
+        if getattr(job_config, 'dry_run', False):
+            return SQLiteQueryJob(cursor=None)
+
+        connection = get_sqlite_connection(self.database_path)
+
+        try:
+            cursor = connection.execute(
+                to_sqlite_query(query_string, [query_parameter.name for query_parameter in query_parameters]),
+                {
+                    query_parameter.name: query_parameter.value
+                    for query_parameter in query_parameters
+                },
+            )
+        except sqlite3.Error as sqlite_error:
+            logger.error('SQLite analytics query error: %s', str(sqlite_error))
+            connection.close()
+
+            return SQLiteQueryJob(cursor=None, errors=[{'message': str(sqlite_error)}])
+
+        return SQLiteQueryJob(cursor=cursor)
+
+
+class SQLiteQueryJob(object):
+    """
+    Local query job with the methods of google.cloud.bigquery.job.QueryJob used by bigquery_module.
+    """
+    total_bytes_processed = 0
+
+    def __init__(self, cursor, errors=None):
+        self.cursor = cursor
+        self.errors = errors
+
+    def exception(self):
+        """
+        The local query is already done, so there is nothing to wait for.
+        """
+        return None
+
+    def cancel(self):
+        """
+        Close the connection of the local query, its rows are not read.
+        """
+        if self.cursor is not None:
+            self.cursor.connection.close()
+
+        return True
+
+    def result(self, page_size=None):
+        """
+        Return a generator of the rows as dicts, fetched page_size rows at a time.
+        """
+        if self.cursor is None:
+            return iter([])
+
+        return iterate_cursor_rows(self.cursor, page_size or 1000)
+
+
+def iterate_cursor_rows(cursor, page_size):
+    """
+    Yield the rows of the cursor as dicts and close its connection once they are consumed.
+
+    Args:
+        cursor: sqlite3.Cursor instance.
+        page_size: Number of rows fetched at a time.
+    """
+    column_names = [column[0] for column in cursor.description or []]
+
+    try:
+        while True:
+            rows = cursor.fetchmany(page_size)
+
+            if not rows:
+                break
+
+            for row in rows:
+                yield dict(zip(column_names, row))
+    finally:
+        cursor.connection.close()
+
+
+def get_sqlite_connection(database_path):
+    """
+    Return a connection to the local analytics database with the Google BigQuery functions used by the queries.
+
+    The connection may be read by a thread other than the one that opened it, e.g. by
+    bigquery_module.get_google_bigquery_data_per_key, but only by one thread at a time.
+
+    Args:
+        database_path: Path of the SQLite database file.
+    Returns:
+        sqlite3.Connection instance.
+    """
+    connection = sqlite3.connect(database_path, check_same_thread=False)
+    connection.create_function('PARSE_DATETIME', 2, parse_datetime)
+    connection.create_function('REGEXP_EXTRACT', 2, regexp_extract)
+
+    return connection
+
+
+def create_time_on_asset_daily_table(connection):
+    """
+    Create the time_on_asset_daily table and its index if they don't exist.
+
+    Args:
+        connection: sqlite3.Connection instance.
+    """
+    connection.execute(TIME_ON_ASSET_DAILY_SCHEMA)
+    connection.execute(TIME_ON_ASSET_DAILY_INDEX)
+
+
+def to_sqlite_query(query_string, parameter_names=()):
+    """
+    Translate a Google BigQuery query of the time_on_asset_daily table to SQLite.
+
+    The `project.dataset.time_on_asset_daily` paths are replaced with the local table name
+    and the @name parameters with the :name SQLite parameters.
+
+    Args:
+        query_string: Google BigQuery standard SQL query string.
+        parameter_names: Names of the query parameters. **Optional**
+    Returns:
+        SQLite query string.
+    """
+    query_string = TABLE_PATH_REGEX.sub(TIME_ON_ASSET_DAILY_TABLE_NAME, query_string)
+
+    for parameter_name in sorted(parameter_names, key=len, reverse=True):
+        query_string = re.sub(r'@{}\b'.format(re.escape(parameter_name)), ':{}'.format(parameter_name), query_string)
+
+    return query_string
+
+
+def parse_datetime(date_format, value):
+    """
+    SQLite implementation of the Google BigQuery PARSE_DATETIME function.
+
+    The datetime is returned in ISO format, so the results can be compared with each other.
+    """
+    if value is None:
+        return None
+
+    # Google BigQuery uses %F for %Y-%m-%d, which the Python parser does not support.
+    return datetime.strptime(value, date_format.replace('%F', '%Y-%m-%d')).isoformat()
+
+
+def regexp_extract(value, regular_expression):
+    """
+    SQLite implementation of the Google BigQuery REGEXP_EXTRACT function.
+    """
+    if value is None:
+        return None
+
+    match = re.search(regular_expression, value)
+
+    if not match:
+        return None
+
+    return match.group(1) if match.groups() else match.group(0)
@@ -0,0 +1,164 @@
+"""
+Command to generate synthetic time_on_asset_daily data in the local SQLite analytics database.
+"""
+import random
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from opaque_keys import InvalidKeyError
+from opaque_keys.edx.keys import CourseKey
+
+from openedx_pearson_reports.edxapp_wrapper.get_block_structure_library import get_course_in_cache
+from openedx_pearson_reports.edxapp_wrapper.get_modulestore import item_not_found_error
+from openedx_pearson_reports.google_services.sqlite_module import (
+    create_time_on_asset_daily_table,
+    get_sqlite_connection,
+)
+from openedx_pearson_reports.utils import get_enrolled_users
+
+DATE_FORMAT = '%Y-%m-%d'
+INSERT_BATCH_SIZE = 10000
+INSERT_QUERY = """
+    INSERT INTO time_on_asset_daily (date, course_id, username, module_id, time_umid5, time_umid30)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+class Command(BaseCommand):
+    """
+    Generate synthetic time_on_asset_daily rows to profile the time spent reports without Google BigQuery.
+
+    The enrolled usernames and the vertical blocks of the course are used when they exist, and
+    synthetic ones are added up to --users and --verticals, so the reports find the generated data.
+    The number of rows is about courses * users * verticals * days * activity ratio,
+    e.g. 10 courses, 2000 users, 100 verticals, 10 days and 0.5 generate 10M rows.
+    """
+    help = 'Generate synthetic time_on_asset_daily data in OPR_ANALYTICS_SQLITE_DATABASE_PATH.'
+
+    def add_arguments(self, parser):
+        """
+        Add the command arguments.
+        """
+        parser.add_argument('--course-id', action='append', dest='course_ids', required=True)
+        parser.add_argument('--database', default=getattr(settings, 'OPR_ANALYTICS_SQLITE_DATABASE_PATH', ''))
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--verticals', type=int, default=100)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--end-date', default=datetime.utcnow().strftime(DATE_FORMAT))
+        parser.add_argument('--activity-ratio', type=float, default=0.3)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        """
+        Generate and insert the rows of every given course, one course per transaction.
+        """
+        if not options['database']:
+            raise CommandError('--database or OPR_ANALYTICS_SQLITE_DATABASE_PATH must be provided.')
+
+        try:
+            end_date = datetime.strptime(options['end_date'], DATE_FORMAT)
+        except ValueError:
+            raise CommandError('--end-date must have the format YYYY-MM-DD.')
+
+        random.seed(options['seed'])
+        dates = [
+            (end_date - timedelta(days=day)).strftime(DATE_FORMAT)
+            for day in range(options['days'])
+        ]
+        connection = get_sqlite_connection(options['database'])
+        create_time_on_asset_daily_table(connection)
+
+        try:
+            for course_id in options['course_ids']:
+                try:
+                    course_key = CourseKey.from_string(course_id)
+                except InvalidKeyError:
+                    raise CommandError('Invalid course id {}.'.format(course_id))
+
+                rows = generate_course_rows(
+                    course_key=course_key,
+                    usernames=get_course_usernames(course_key, options['users']),
+                    module_ids=get_course_vertical_module_ids(course_key, options['verticals']),
+                    dates=dates,
+                    activity_ratio=options['activity_ratio'],
+                )
+                batch = []
+                course_rows = 0
+
+                for row in rows:
+                    batch.append(row)
+
+                    if len(batch) >= INSERT_BATCH_SIZE:
+                        connection.executemany(INSERT_QUERY, batch)
+                        course_rows += len(batch)
+                        batch = []
+
+                if batch:
+                    connection.executemany(INSERT_QUERY, batch)
+                    course_rows += len(batch)
+
+                connection.commit()
+                self.stdout.write('{}: {} rows generated.'.format(course_id, course_rows))
+        finally:
+            connection.close()
+
+
+def get_course_usernames(course_key, number_of_users):
+    """
+    Return the enrolled usernames of the course, completed with synthetic usernames up to number_of_users.
+    """
+    usernames = list(
+        get_enrolled_users(course_key, include_staff_users=True).values_list('username', flat=True)[:number_of_users],
+    )
+    usernames.extend(
+        'synthetic_user_{}'.format(index) for index in range(len(usernames), number_of_users)
+    )
+
+    return usernames
+
+
+def get_course_vertical_module_ids(course_key, number_of_verticals):
+    """
+    Return the vertical usage ids of the course, completed with synthetic ones up to number_of_verticals.
+    """
+    try:
+        block_structure = get_course_in_cache(course_key)
+        module_ids = [
+            str(block_key) for block_key in block_structure.topological_traversal()
+            if block_key.block_type == 'vertical'
+        ][:number_of_verticals]
+    except item_not_found_error():
+        module_ids = []
+
+    module_ids.extend(
+        str(course_key.make_usage_key('vertical', 'synthetic_vertical_{}'.format(index)))
+        for index in range(len(module_ids), number_of_verticals)
+    )
+
+    return module_ids
+
+
+def generate_course_rows(course_key, usernames, module_ids, dates, activity_ratio):
+    """
+    Yield the synthetic time_on_asset_daily rows of the course.
+
+    Args:
+        course_key: Opaque course key object.
+        usernames: List of usernames.
+        module_ids: List of vertical usage id strings.
+        dates: List of date strings.
+        activity_ratio: Probability of a row for each date, user and vertical.
+    """
+    course_id = str(course_key)
+
+    for date in dates:
+        for username in usernames:
+            for module_id in module_ids:
+                if random.random() >= activity_ratio:
+                    continue
+
+                time_umid5 = round(random.expovariate(1 / 120.0), 2)
+                time_umid30 = round(time_umid5 + random.expovariate(1 / 60.0), 2)
+
+                yield (date, course_id, username, module_id, time_umid5, time_umid30)
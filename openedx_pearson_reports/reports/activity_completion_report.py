@@ -3,12 +3,12 @@ Activity completion report module.
 """
 from __future__ import division
 import logging
+from collections import Counter
 
-from django.core.exceptions import ObjectDoesNotExist
 from opaque_keys import InvalidKeyError
 from opaque_keys.edx.locator import BlockUsageLocator
 
-from openedx_pearson_reports.utils import get_required_activity_dict
+from openedx_pearson_reports.utils import get_required_activity_dict, get_user_course_enrollments
 from openedx_pearson_reports.edxapp_wrapper.get_block_structure_library import get_course_in_cache
 from openedx_pearson_reports.edxapp_wrapper.get_completion_models import get_block_completion_model
 from openedx_pearson_reports.edxapp_wrapper.get_courseware_library import get_course_by_id
@@ -16,7 +16,7 @@ from openedx_pearson_reports.edxapp_wrapper.get_modulestore import (
     get_modulestore,
     item_not_found_error,
 )
-from openedx_pearson_reports.edxapp_wrapper.get_student_library import get_user
+from openedx_pearson_reports.edxapp_wrapper.get_student_library import get_course_enrollment
 
 
 logger = logging.getLogger(__name__)
@@ -28,16 +28,30 @@ class GenerateCompletionReport(object):
     """
     course_block_structure = None
 
-    def __init__(self, users, course_key, required_block_ids, block_types, passing_score):
+    def __init__(self, users, course_key, required_block_ids, block_types, passing_score, course_structure_cache=None):
+        """
+        Args:
+            users: Users to include in the report.
+            course_key: Opaque course key object.
+            required_block_ids: List of the required block location ids.
+            block_types: List of the required block types.
+            passing_score: Percentage of the activities that must be completed.
+            course_structure_cache: Optional dict shared between instances to resolve
+                                    the required blocks of the same course only once.
+        """
         self.users = users
         self.course_key = course_key
         self.required_block_types = block_types
-        self.required_block_ids = self.get_course_required_block_ids(required_block_ids)
+        self.required_block_ids, self.required_block_names = self.get_course_required_blocks(
+            required_block_ids,
+            course_structure_cache,
+        )
         self.passing_score = passing_score
 
 
     @classmethod
-    def activity_completion_data_per_user(cls, user, course_key, block_types, passing_score):
+    def activity_completion_data_per_user(cls, user, course_key, block_types, passing_score,
+                                          course_structure_cache=None):
         """
         Returns the GenerateCompletionReport class by passing a default value to the required_block_ids argument.
         This is intended to use the same logic without change the class it all.
@@ -50,6 +64,7 @@ class GenerateCompletionReport(object):
             required_block_ids=[],
             block_types=block_types,
             passing_score=passing_score,
+            course_structure_cache=course_structure_cache,
         )
 
 
@@ -84,57 +99,55 @@ class GenerateCompletionReport(object):
     def generate_report_data(self):
         """
         Returns a dict with the users data per course.
+
+        The users are expected to have their profile already joined,
+        e.g. User.objects.select_related('profile'), so no user data is fetched per user.
         """
         activity_completion_data = []
         required_ids = self.required_block_ids
+        enrollment_ids = self.get_enrollment_ids()
 
         for user in self.users:
-            user, user_profile = get_user(user.email)
-            first_name, last_name = get_first_and_last_name(user_profile.name)
+            user_enrollment_id = enrollment_ids.get(user.id)
+
+            if user_enrollment_id is None:
+                continue
+
+            first_name, last_name = get_first_and_last_name(user.profile.name)
             completed_activities = self.get_completed_activities(user)
             last_login = user.last_login
             display_last_login = None
 
-            try:
-                user_enrollment = user.courseenrollment_set.get(
-                    course_id=self.course_key,
-                )
-            except ObjectDoesNotExist:
-                continue
-
             # Last login could not be defined for a user.
             if last_login:
                 display_last_login = last_login.strftime('%Y/%m/%d %H:%M:%S')
 
             total_activities = 0
+            activities_state, completed_count = get_required_activities_completion(
+                required_ids,
+                completed_activities,
+            )
             data = {
                 'first_name': first_name,
                 'last_name': last_name,
                 'email': user.email,
                 'first_login': user.date_joined.strftime('%Y/%m/%d %H:%M:%S'),
                 'last_login': display_last_login,
-                'completed_activities': len(filter_completed_blocks(
-                    required_ids,
-                    completed_activities,
-                )),
-                'course_is_complete': is_course_activities_complete(
-                    required_ids,
-                    completed_activities,
+                'completed_activities': completed_count,
+                'course_is_complete': is_passing_score(
+                    completed_count,
+                    len(required_ids),
                     self.passing_score,
                 ),
-                'student_enrollment_id': user_enrollment.id,
+                'student_enrollment_id': user_enrollment_id,
             }
 
-            for index, item in enumerate(required_ids, 1):
-                state = is_activity_completed(item.block_id, completed_activities)
+            for index, (name, state) in enumerate(zip(self.required_block_names, activities_state), 1):
                 total_activities += 1
 
                 data.update({
                     'required_activity_{}'.format(index): state,
-                    'required_activity_{}_name'.format(index): self.course_block_structure.get_xblock_field(
-                        item,
-                        'display_name',
-                    ),
+                    'required_activity_{}_name'.format(index): name,
                 })
 
             data.update({
@@ -146,6 +159,21 @@ class GenerateCompletionReport(object):
         return activity_completion_data
 
 
+    def get_enrollment_ids(self):
+        """
+        Returns a dict with the course enrollment id of every user, fetched with a single query.
+
+        Returns:
+            Dict: {user_id: enrollment_id}
+        """
+        return dict(
+            get_course_enrollment().objects.filter(
+                course_id=self.course_key,
+                user__in=self.users,
+            ).values_list('user_id', 'id')
+        )
+
+
     def get_completed_activities(self, user):
         """
         Returns blocks that have been completed by the user.
@@ -153,6 +181,43 @@ class GenerateCompletionReport(object):
         return get_block_completion_model().get_course_completions(user, self.course_key)
 
 
+    def get_course_required_blocks(self, required_block_ids, course_structure_cache=None):
+        """
+        Returns the required blocks of the course and their display names.
+
+        If course_structure_cache is provided, the result is stored on it by
+        (course_key, block types, required block ids), so the course structure
+        is loaded and traversed only once for all the instances sharing the dict.
+
+        Args:
+            required_block_ids: List of the block location ids.
+            course_structure_cache: Dict to memoize the resolved blocks. **Optional**
+        Returns:
+            Tuple: (
+                List containing the required BlockUsageLocator items.
+                List containing the display name of every required block.
+            )
+        """
+        cache_key = (self.course_key, tuple(self.required_block_types), tuple(required_block_ids))
+
+        if course_structure_cache is not None and cache_key in course_structure_cache:
+            return course_structure_cache[cache_key]
+
+        course_required_block_ids = self.get_course_required_block_ids(required_block_ids)
+        required_block_names = [
+            self.course_block_structure.get_xblock_field(
+                block,
+                'display_name',
+            ) if self.course_block_structure else None
+            for block in course_required_block_ids
+        ]
+
+        if course_structure_cache is not None:
+            course_structure_cache[cache_key] = (course_required_block_ids, required_block_names)
+
+        return course_required_block_ids, required_block_names
+
+
     def get_course_required_block_ids(self, required_block_ids):
         """
         Filters the required_block_ids list, and returns
@@ -214,75 +279,110 @@ class GenerateCompletionReport(object):
         return user_activity_completion_data
 
 
-def is_activity_completed(block_id, activities):
+def get_required_activities_completion(required_blocks, completed_activities):
     """
-    Verifies if the block_id exist for the given activity list.
-    """
-    for activity in activities:
-        if block_id == activity.block_id:
-            return 'completed'
-
-    return 'not_completed'
+    Return the completion state of every required block and the number of completed required blocks.
 
+    The completed activities are indexed by block id once, so every required block
+    is matched without scanning all the completed activities.
 
-def get_first_and_last_name(full_name):
-    """
-    Takes the argument full_name a returns a list with the first name and last name.
+    Args:
+        required_blocks: All the requested BlockUsageLocator items.
+        completed_activities: All the completed BlockUsageLocator items per user.
+    Returns:
+        Tuple: (
+            List with 'completed' or 'not_completed' for every required block.
+            Number of completed activities that exists in the required_blocks list.
+        )
     """
-    try:
-        result = full_name.split(' ', 1)
-    except AttributeError:
-        return ['', '']
-    else:
-        if len(result) == 2:
-            return result
-        return [full_name, full_name]
+    completed_block_ids = Counter(block_completed.block_id for block_completed in completed_activities)
+    activities_state = []
+    completed_count = 0
+
+    for activity_block in required_blocks:
+        block_completed_count = completed_block_ids.get(activity_block.block_id, 0)
+        completed_count += block_completed_count
+        activities_state.append('completed' if block_completed_count else 'not_completed')
+
+    return activities_state, completed_count
 
 
-def is_course_activities_complete(course_blocks, completed_activities, passing_score):
+def is_passing_score(completed_count, required_count, passing_score):
     """
-    Verifies if the course is complete depending on the total of the provided course_blocks,
-    divided by the total of completed blocks if it is greater than or equal to passing_score.
+    Verifies if the number of completed required blocks reaches the passing_score.
 
     PASS = ( COUNT OF BLOCKS COMPLETED / COUNT OF TOTAL COURSE BLOCKS ) >= passing_score
 
     Args:
-        course_blocks: All the required BlockUsageLocator items.
-        completed_activities: All the BlockUsageLocator completion items per user.
+        completed_count: Number of completed required blocks.
+        required_count: Number of required blocks.
         passing_score: Percentage of the completed activities.
-    Retunrs:
+    Returns:
         Boolean: True if the user has completed the course activities
             depending on the calculation, if not False.
     """
-    required_completed_activities = filter_completed_blocks(
-        course_blocks,
-        completed_activities,
-    )
-
-    if not required_completed_activities:
+    if not completed_count:
         return False
 
-    return (len(required_completed_activities) / len(course_blocks)) >= passing_score
+    return (completed_count / required_count) >= passing_score
 
 
-def filter_completed_blocks(required_blocks, completed_activities):
+def get_users_activity_completion_data(user_list, course_keys, block_types, passing_score):
     """
-    Filters the activities completed by the required blocks.
-    This is in order to get only the completed activities that exists in the
-    required blocks.
+    Returns the activity completion data per user and course.
 
     Args:
-        required_blocks: All the requested BlockUsageLocator items.
-        completed_activities: All the completed BlockUsageLocator items per user.
+        user_list: List of django.contrib.auth.models.User instances with their profile joined.
+        course_keys: List of opaque course key objects. If it is empty, the courses
+                     where every user is enrolled are used.
+        block_types: List of the block types to get the completion data.
+        passing_score: Percentage of the activities that must be completed.
     Returns:
-        required_block_filter_list: List with only the completed activities that exists
-            in the required_blocks list.
+        Dict: {
+            user email: {
+                course id: GenerateCompletionReport.get_user_completion_data value.
+            }
+        }
     """
-    required_block_filter_list = []
+    completion_data = {}
+    # The course structures are resolved only once per call.
+    course_structure_cache = {}
+
+    for user in user_list:
+        user_course_keys = course_keys or get_user_course_enrollments(user)
+        course_user_completion_data = {}
+
+        for course_key in user_course_keys:
+            activity_completion_data = GenerateCompletionReport.activity_completion_data_per_user(
+                user=user,
+                course_key=course_key,
+                block_types=block_types,
+                passing_score=passing_score,
+                course_structure_cache=course_structure_cache,
+            ).get_user_completion_data()
+
+            course_data = {
+                str(course_key): activity_completion_data,
+            }
 
-    for activity_block in required_blocks:
-        for block_completed in completed_activities:
-            if block_completed.block_id == activity_block.block_id:
-                required_block_filter_list.append(block_completed)
+            course_user_completion_data.update(course_data)
+
+        completion_data.update({
+            user.email: course_user_completion_data,
+        })
 
-    return required_block_filter_list
+    return completion_data
+
+
+def get_first_and_last_name(full_name):
+    """
+    Takes the argument full_name a returns a list with the first name and last name.
+    """
+    try:
+        result = full_name.split(' ', 1)
+    except AttributeError:
+        return ['', '']
+    else:
+        if len(result) == 2:
+            return result
+        return [full_name, full_name]
@@ -9,7 +9,8 @@ from rest_framework.reverse import reverse
 from openedx_pearson_reports.edxapp_wrapper.get_student_library import (
     user_readonly_serializer,
 )
-from openedx_pearson_reports.utils import get_enrolled_users
+from openedx_pearson_reports.serializers import GenerateReportViewSerializer
+from openedx_pearson_reports.utils import get_enrolled_users, get_report_backend
 
 
 class BaseReportBackend(object):
@@ -25,12 +26,17 @@ class BaseReportBackend(object):
         self.user_serializer_fields = kwargs.pop('user_serializer_fields', [])
         self.generate_report_data_task = kwargs.pop('generate_report_data_task', generate_report_data)
         self.include_staff_users = kwargs.pop('include_staff_users', False)
+        self.report_name = kwargs.pop('report_name', '')
 
     def process_request(self, request, extra_data):
         """
         Process the report generation request.
         Manage the report pagination by the enrolled users.
 
+        If the 'background_fan_out' report backend setting is True, the pages are created by the
+        plan_report_pages task instead, and the response contains its get-report-data URL, whose
+        result is the same course pages dict that is returned by the synchronous requests.
+
         Args:
             request: django.http.request.HttpRequest object.
             extra_data: Dict that contains additional data.
@@ -38,6 +44,35 @@ class BaseReportBackend(object):
             BaseReportBackend.process_response object.
         """
         get_report_data_url = request.build_absolute_uri(reverse('pearson-reports:api:v1:get-report-data'))
+
+        if self.settings.get('background_fan_out', False) and self.report_name:
+            planner_task = plan_report_pages.delay(
+                report_name=self.report_name,
+                course_ids=self.course_ids,
+                limit=self.limit,
+                extra_data=extra_data,
+                get_report_data_url=get_report_data_url,
+            )
+
+            return self.process_response(report_pages={
+                'report_pages_url': '{}?task_id={}'.format(get_report_data_url, planner_task.id),
+            })
+
+        return self.process_response(
+            report_pages=self.dispatch_report_pages(get_report_data_url, extra_data, request),
+        )
+
+    def dispatch_report_pages(self, get_report_data_url, extra_data, request=None):
+        """
+        Split the enrolled users of every course in pages and start a report task for each page.
+
+        Args:
+            get_report_data_url: Absolute URL of the get-report-data API endpoint.
+            extra_data: Dict that contains additional data.
+            request: django.http.request.HttpRequest object. None in the plan_report_pages task.
+        Returns:
+            Dict: {course id: List of the get-report-data URLs of the course pages}
+        """
         course_report_pages = {}
 
         for course_key in self.course_keys:
@@ -65,7 +100,7 @@ class BaseReportBackend(object):
                 str(course_key): report_pages,
             })
 
-        return self.process_response(report_pages=course_report_pages)
+        return course_report_pages
 
     def process_response(self, *args, **kwargs):
         """
@@ -128,6 +163,35 @@ class BaseReportBackend(object):
         return clean_data
 
 
+@task()
+def plan_report_pages(report_name, course_ids, limit, extra_data, get_report_data_url):
+    """
+    Celery task to split the enrolled users of the requested courses in pages and start their report tasks,
+    so the report request doesn't wait for the enrolled users enumeration and serialization.
+
+    Args:
+        report_name: Name of the requested report.
+        course_ids: List of course ids.
+        limit: Requested number of users per page.
+        extra_data: Dict that contains additional data.
+        get_report_data_url: Absolute URL of the get-report-data API endpoint.
+    Returns:
+        Dict: {course id: List of the get-report-data URLs of the course pages}
+    """
+    report_backend, report_backend_settings = get_report_backend(report_name)
+    serialized_data = GenerateReportViewSerializer(data={'course_ids': course_ids, 'limit': limit})
+
+    serialized_data.is_valid(raise_exception=True)
+
+    backend_instance = report_backend(
+        report_settings=report_backend_settings,
+        report_name=report_name,
+        **serialized_data.data
+    )
+
+    return backend_instance.dispatch_report_pages(get_report_data_url, extra_data)
+
+
 @task()
 def generate_report_data(*args, **kwargs):  # pylint: disable=unused-argument
     """
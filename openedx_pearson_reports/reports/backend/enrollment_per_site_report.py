@@ -1,22 +1,28 @@
 """
 Enrollment per site report backend.
 """
+import hashlib
 from importlib import import_module
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Min
+from google.cloud import bigquery
 from opaque_keys.edx.keys import CourseKey
 from rest_framework import status
 
 from openedx_pearson_reports.google_services.bigquery_module import (
+    get_cached_google_bigquery_data,
     get_google_bigquery_course_id,
-    get_google_bigquery_data,
+    get_google_bigquery_limit_clause,
     GoogleBigQueryInformationError,
 )
 from openedx_pearson_reports.reports.backend.base import BaseReportBackend
 from openedx_pearson_reports.edxapp_wrapper.get_courseware_library import student_module
 from openedx_pearson_reports.edxapp_wrapper.get_student_library import user_attribute, user_signup_source
-from openedx_pearson_reports.utils import get_course_enrollment, get_user_role
+from openedx_pearson_reports.utils import get_course_enrollment, get_user_roles
 
+REGISTERED_USERS_CACHE_KEY_PREFIX = 'openedx_pearson_reports.registered_users'
 SUPPORTED_TASKS_MODULE = 'openedx_pearson_reports.tasks'
 
 class EnrollmentReportPerSiteBackend(BaseReportBackend):
@@ -58,19 +64,47 @@ class EnrollmentReportPerSiteBackend(BaseReportBackend):
                 'status': status.HTTP_400_BAD_REQUEST,
             }
 
-        users_created_on_site = user_attribute().objects.values('user').filter(name='created_on_site', value=site_name)
-        # Support backwards compatibility with microsites.
-        users_signup_source = user_signup_source().objects.values('user').filter(site=site_name)
-        filter_users_on_site = set.union(
-            set([created_on_site.get('user', '') for created_on_site in users_created_on_site]),
-            set([signup_source.get('user', '') for signup_source in users_signup_source]),
-        )
-
-        extra_data.update({'registered_users': len(filter_users_on_site)})
+        extra_data.update({'registered_users': get_site_registered_users_count(site_name)})
 
         return super(EnrollmentReportPerSiteBackend, self).process_request(request, extra_data)
 
 
+def get_site_registered_users_count(site_name):
+    """
+    Return the number of users registered in the given site.
+
+    The users are counted by the database with a UNION of the created_on_site user attributes and the
+    signup sources, and the count is cached for OPR_REGISTERED_USERS_CACHE_TIMEOUT seconds per site.
+
+    Args:
+        site_name: Site name string.
+    Returns:
+        Number of registered users.
+    """
+    cache_timeout = getattr(settings, 'OPR_REGISTERED_USERS_CACHE_TIMEOUT', 0)
+    cache_key = '{}.{}'.format(
+        REGISTERED_USERS_CACHE_KEY_PREFIX,
+        hashlib.md5(site_name.encode('utf-8')).hexdigest(),
+    )
+
+    if cache_timeout:
+        registered_users = cache.get(cache_key)
+
+        if registered_users is not None:
+            return registered_users
+
+    users_created_on_site = user_attribute().objects.filter(name='created_on_site', value=site_name).values('user')
+    # Support backwards compatibility with microsites.
+    users_signup_source = user_signup_source().objects.filter(site=site_name).values('user')
+    # UNION removes the duplicated users, so the count is the number of distinct users.
+    registered_users = users_created_on_site.union(users_signup_source).count()
+
+    if cache_timeout:
+        cache.set(cache_key, registered_users, cache_timeout)
+
+    return registered_users
+
+
 def generate_enrollment_per_site_report(course_key, enrolled_users):
     """
     Return the report data.
@@ -89,49 +123,76 @@ def generate_enrollment_per_site_report(course_key, enrolled_users):
         }]
     """
     report_data = []
-    bigquery_data = list(
-        get_google_bigquery_data(
-            query_string=get_google_bigquery_query(
-                course_dataset_name=get_google_bigquery_course_id(course_key),
-                course_id=str(course_key),
-            ),
-        ),
+    query_string, query_parameters = get_google_bigquery_query(
+        course_dataset_name=get_google_bigquery_course_id(course_key),
+        course_id=str(course_key),
+    )
+    # The mapping is built once per course and shared by all the page tasks of the report.
+    time_spent_per_username = get_cached_google_bigquery_data(
+        query_string=query_string,
+        query_parameters=query_parameters,
+        process_rows=get_time_spent_per_username,
     )
 
-    for user in enrolled_users:
-        enrollment = get_course_enrollment().objects.filter(
-            user__email=user.get('email', ''),
-            course_id=course_key,
-        )
-        first_student_module_object = student_module().objects.filter(
-            student__username=user.get('username', ''),
+    enrolled_users = list(enrolled_users)
+    enrollments = {}
+    course_enrollments = get_course_enrollment().objects.filter(
+        user__email__in=[user.get('email', '') for user in enrolled_users],
+        course_id=course_key,
+    ).select_related('user').order_by('id')
+
+    for enrollment in course_enrollments:
+        enrollments.setdefault(enrollment.user.email, enrollment)
+
+    first_access_dates = dict(
+        student_module().objects.filter(
+            student__username__in=[user.get('username', '') for user in enrolled_users],
             course_id=course_key,
-        ).order_by('created').first()
+        ).values('student__username').annotate(
+            first_access=Min('created'),
+        ).values_list('student__username', 'first_access')
+    )
+    user_roles = get_user_roles(
+        [enrollment.user_id for enrollment in enrollments.values()],
+        course_key,
+    )
+
+    for user in enrolled_users:
+        enrollment = enrollments.get(user.get('email', ''))
 
         if not enrollment:
             continue
 
-        time_spent_per_user = 0
-
-        for time_spent_data in bigquery_data:
-            if time_spent_data.get('username', '') == user.get('username', ''):
-                time_spent_per_user = time_spent_data.get('total_time_spent', 0)
+        first_access_date = first_access_dates.get(user.get('username', ''))
 
         report_data.append({
             'username': user.get('username', ''),
             'email': user.get('email', ''),
-            'date_of_enrollment': str(enrollment[0].created),
+            'date_of_enrollment': str(enrollment.created),
             'date_of_registration': user.get('date_joined', ''),
-            'role': get_user_role(enrollment[0].user, course_key),
-            'time_spent': time_spent_per_user,
-            'date_of_first_access_to_course': str(
-                first_student_module_object.created,
-            ) if first_student_module_object else '',
+            'role': user_roles.get(enrollment.user_id, 'student'),
+            'time_spent': time_spent_per_username.get(user.get('username', ''), 0),
+            'date_of_first_access_to_course': str(first_access_date) if first_access_date else '',
         })
 
     return report_data
 
 
+def get_time_spent_per_username(bigquery_data):
+    """
+    Return the total time spent of the Google BigQuery rows by username.
+
+    Args:
+        bigquery_data: Iterable of the Google BigQuery rows.
+    Returns:
+        Dict: {username: total time spent}
+    """
+    return {
+        time_spent_data.get('username', ''): time_spent_data.get('total_time_spent', 0)
+        for time_spent_data in bigquery_data
+    }
+
+
 def get_google_bigquery_query(course_dataset_name, course_id):
     """
     Return the Google BigQuery query for the time_on_asset_daily table.
@@ -142,12 +203,12 @@ def get_google_bigquery_query(course_dataset_name, course_id):
         course_id: Course id string.
     Returns:
         query_string: The query string to make the query.
+        query_parameters: List of google.cloud.bigquery.ScalarQueryParameter instances.
     Raises:
         GoogleBigQueryInformationError: If OPR_GOOGLE_CLOUD_PROJECT_ID or course_dataset_name
                                         were not provided or are None.
     """
     google_project_id = getattr(settings, 'OPR_GOOGLE_CLOUD_PROJECT_ID', '')
-    query_max_result_number = getattr(settings, 'OPR_GOOGLE_BIGQUERY_MAX_NUMBER_RESULTS_PER_QUERY', 1000)
 
     if not google_project_id or not course_dataset_name:
         raise GoogleBigQueryInformationError('Google cloud project id or course_dataset_name are missing.')
@@ -155,15 +216,17 @@ def get_google_bigquery_query(course_dataset_name, course_id):
     query_string = """
         SELECT username, SUM(time_umid30) AS total_time_spent
         FROM `{google_project_id}.{bigquery_dataset}.time_on_asset_daily`
-        WHERE course_id = '{course_id}'
+        WHERE course_id = @course_id
         AND time_umid30 IS NOT NULL
         GROUP BY username
-        LIMIT {max_result_number}
+        {limit_clause}
     """.format(
         google_project_id=google_project_id,
         bigquery_dataset=course_dataset_name,
-        course_id=course_id,
-        max_result_number=query_max_result_number,
+        limit_clause=get_google_bigquery_limit_clause(),
     )
+    query_parameters = [
+        bigquery.ScalarQueryParameter('course_id', 'STRING', course_id),
+    ]
 
-    return query_string
+    return query_string, query_parameters
@@ -1,20 +1,44 @@
 """
 Completion report backend.
 """
-import copy
+import hashlib
+from collections import namedtuple
 from importlib import import_module
 
-from openedx_pearson_reports.edxapp_wrapper.get_completion_models import get_block_completion_model
-from openedx_pearson_reports.edxapp_wrapper.get_course_api import get_supported_fields
+from django.conf import settings
+from django.core.cache import cache
+
+from openedx_pearson_reports.edxapp_wrapper.get_completion_models import get_learning_context_completions_by_users
 from openedx_pearson_reports.edxapp_wrapper.get_course_blocks import get_course_blocks
-from openedx_pearson_reports.edxapp_wrapper.get_course_cohort import get_course_cohort
-from openedx_pearson_reports.edxapp_wrapper.get_course_teams import get_course_teams
+from openedx_pearson_reports.edxapp_wrapper.get_course_cohort import get_course_cohort_names
+from openedx_pearson_reports.edxapp_wrapper.get_course_content import course_overview
+from openedx_pearson_reports.edxapp_wrapper.get_course_teams import get_course_team_names
 from openedx_pearson_reports.edxapp_wrapper.get_modulestore import get_modulestore
 from openedx_pearson_reports.reports.backend.base import BaseReportBackend
-from openedx_pearson_reports.utils import get_exisiting_users_by_email
+from openedx_pearson_reports.utils import LRUCache, get_exisiting_users_by_email
 
 SUPPORTED_TASKS_MODULE = 'openedx_pearson_reports.tasks'
 BLOCK_DEFAULT_REPORT_FILTER = ['vertical']
+COMPACT_OUTPUT_FORMAT = 'compact'
+NOT_COMPLETABLE_BLOCK_TYPES = ('discussion',)
+COURSE_TREE_CACHE = LRUCache(
+    max_size=getattr(settings, 'OPR_COURSE_TREE_CACHE_SIZE', 32),
+    timeout=getattr(settings, 'OPR_COURSE_TREE_CACHE_TIMEOUT', 3600),
+)
+COURSE_TREE_CACHE_KEY_PREFIX = 'openedx_pearson_reports.course_tree'
+
+CourseTree = namedtuple(
+    'CourseTree',
+    [
+        'block_keys',
+        'block_types',
+        'display_names',
+        'position_numbers',
+        'parents',
+        'children',
+        'completable_children_count',
+    ],
+)
 
 class CompletionReportBackend(BaseReportBackend):
     """
@@ -41,6 +65,9 @@ class CompletionReportBackend(BaseReportBackend):
         Args:
             request: django.http.request.HttpRequest object.
             extra_data: Dict that contains additional data.
+                block_report_filter: List of block types to include in the report. **Optional**
+                output_format: 'compact' to get the course outline once per page and
+                               a completion bit string per user. **Optional**
         Returns:
             BaseReportBackend.process_response object.
         """
@@ -51,7 +78,7 @@ class CompletionReportBackend(BaseReportBackend):
         return super(CompletionReportBackend, self).process_request(request, extra_data)
 
 
-def generate_completion_report(course_key, enrolled_users, block_report_filter):
+def generate_completion_report(course_key, enrolled_users, block_report_filter, output_format=''):
     """
     Return the report data.
 
@@ -59,6 +86,7 @@ def generate_completion_report(course_key, enrolled_users, block_report_filter):
         course_key: Opaque course key object.
         enrolled_users: List that contains information about the enrolled users.
         block_report_filter: Block type name to filter the report. e.g. vertical, chapter...
+        output_format: COMPACT_OUTPUT_FORMAT to get the data of generate_report_as_compact_data.
     Returns:
         List of dicts: [{
             cohort: User cohort name.
@@ -83,106 +111,263 @@ def generate_completion_report(course_key, enrolled_users, block_report_filter):
     if not enrolled_users_objects:
         return {}
 
+    if output_format == COMPACT_OUTPUT_FORMAT:
+        return generate_report_as_compact_data(
+            users=enrolled_users_objects,
+            course_key=course_key,
+            block_report_filter=block_report_filter,
+            root_block=get_cached_root_block(enrolled_users_objects[0], course_key),
+        )
+
     return generate_report_as_list(
         users=enrolled_users_objects,
         course_key=course_key,
         block_report_filter=block_report_filter,
-        root_block=get_root_block(enrolled_users_objects[0], course_key),
+        root_block=get_cached_root_block(enrolled_users_objects[0], course_key),
     )
 
 
 def generate_report_as_list(users, course_key, block_report_filter, root_block):
     """
     Returns a list with the user information for every block in block_report_filter.
-    """
-
-    def update_user_dict(child, user_data, section=None, subsection=None, vertical=None):
-        """
-        Returns the complete data for the given values.
-        """
-        if child.get('type') in block_report_filter:
 
-            type_data = user_data.get(child.get('type'), [])
+    Args:
+        users: List of django.contrib.auth.models.User instances.
+        course_key: Opaque course key object.
+        block_report_filter: Block type names to filter the report.
+        root_block: CourseTree instance of the course.
+    """
+    data = []
+    report_blocks = get_report_blocks(root_block, block_report_filter)
 
+    for user_data, completion_state in get_users_completion_data(users, course_key, root_block):
+        for block_index, block_type, block_name, block_number, parents_data in report_blocks:
             child_data = dict(
-                name=child.get('display_name'),
-                complete=child.get('complete'),
-                number=child.get('position_number'),
+                name=block_name,
+                complete=bool(completion_state[block_index]),
+                number=block_number,
             )
+            child_data.update(parents_data)
+            user_data.setdefault(block_type, []).append(child_data)
 
-            if section and section != child:
-                child_data['section_name'] = section.get('display_name')
-                child_data['section_number'] = section.get('position_number')
+        data.append(user_data)
 
-            if subsection and subsection != child:
-                child_data['subsection_name'] = subsection.get('display_name')
-                child_data['subsection_number'] = subsection.get('position_number')
+    return data
 
-            if vertical and vertical != child:
-                child_data['vertical_name'] = vertical.get('display_name')
-                child_data['vertical_number'] = vertical.get('position_number')
 
-            type_data.append(child_data)
+def generate_report_as_compact_data(users, course_key, block_report_filter, root_block):
+    """
+    Returns the report data with the course outline only once.
 
-            user_data[child.get('type')] = type_data
+    Every outline item contains the same block data of generate_report_as_list, except the
+    completion value. The completion of every user is a string with a '1' or '0' character
+    for each outline item, in the same order.
 
-    data = []
-    for user in users:
-        block_data = copy.deepcopy(root_block)
-        mark_blocks_completed(block_data, user, course_key)
-        sections = block_data.get('children', [])
-        cohort = get_course_cohort(user=user, course_key=course_key)
-        user_teams = get_course_teams(membership__user=user, course_id=course_key)
+    Args:
+        users: List of django.contrib.auth.models.User instances.
+        course_key: Opaque course key object.
+        block_report_filter: Block type names to filter the report.
+        root_block: CourseTree instance of the course.
+    Returns:
+        Dict: {
+            outline: [{
+                type: Block type.
+                name: Display name of the block.
+                number: Block place value.
+                section_name: Display name of the section.
+                section_number: Section place value.
+                subsection_name: Display name of the subsection.
+                subsection_number: Subsection place value.
+                vertical_name: Display name of the vertical.
+                vertical_number: Vertical place value.
+            }]
+            users: [{
+                cohort: User cohort name.
+                completion: Completion string aligned with the outline. e.g. '0110'
+                team: User team name.
+                user_id: User id value.
+                username: Username value.
+            }]
+        }
+    """
+    report_blocks = get_report_blocks(root_block, block_report_filter)
+    outline = []
+    users_data = []
+
+    for _, block_type, block_name, block_number, parents_data in report_blocks:
+        block_data = dict(
+            type=block_type,
+            name=block_name,
+            number=block_number,
+        )
+        block_data.update(parents_data)
+        outline.append(block_data)
+
+    for user_data, completion_state in get_users_completion_data(users, course_key, root_block):
+        user_data['completion'] = ''.join(
+            '1' if completion_state[report_block[0]] else '0' for report_block in report_blocks
+        )
+        users_data.append(user_data)
+
+    return {
+        'outline': outline,
+        'users': users_data,
+    }
+
+
+def get_users_completion_data(users, course_key, root_block):
+    """
+    Yield the user data and the completion state of every user.
 
+    Args:
+        users: List of django.contrib.auth.models.User instances.
+        course_key: Opaque course key object.
+        root_block: CourseTree instance of the course.
+    Yields:
+        Tuple: (
+            Dict with the username, user_id, cohort and team of the user.
+            Completion state of the user as returned by get_completion_state.
+        )
+    """
+    block_completions_by_user = get_block_completions_by_user(users, course_key)
+    cohort_names = get_course_cohort_names(course_key, users)
+    team_names = get_course_team_names(course_key, users)
+
+    for user in users:
         user_data = dict(
             username=user.username,
             user_id=user.id,
-            cohort=cohort.name if cohort else '',
-            team=user_teams[0].name if user_teams else '',
+            cohort=cohort_names.get(user.id, ''),
+            team=team_names.get(user.id, ''),
         )
 
-        for section in sections:
-            update_user_dict(section, user_data)
-            for subsection in section.get('children', []):
-                update_user_dict(subsection, user_data, section)
-                for vertical in subsection.get('children', []):
-                    update_user_dict(vertical, user_data, section, subsection)
-                    for component in vertical.get('children', []):
-                        update_user_dict(component, user_data, section, subsection, vertical)
+        yield user_data, get_completion_state(root_block, block_completions_by_user.get(user.id, {}))
 
-        data.append(user_data)
 
-    return data
+def get_report_blocks(course_tree, block_report_filter):
+    """
+    Return the static data of the course tree blocks included in the report.
 
+    Only the sections and up to three levels of their descendants are included,
+    in the same order they have in the course.
 
-def get_root_block(user, course_key):
-    """
-    Returns the content course as dict.
+    Args:
+        course_tree: CourseTree instance.
+        block_report_filter: Block type names to filter the report.
+    Returns:
+        List of tuples: [(
+            Index of the block in the course tree.
+            Block type.
+            Display name of the block.
+            Block place value.
+            Tuple with the (key, value) items of the section, subsection and vertical parents.
+        )]
     """
+    report_blocks = []
+    parent_prefixes = ('section', 'subsection', 'vertical')
 
-    def populate_children(block, all_blocks, counter={}):
+    def add_report_block(block_index, parent_indexes):
         """
-        Replace each child id with the full block for the child.
-
-        Given a block, replaces each id in its children array with the full
-        representation of that child, which will be looked up by id in the
-        passed all_blocks dict. Recursively do the same replacement for children
-        of those children.
+        Append the block to the report blocks if its type is required.
         """
-        children = block.get('children', [])
-        block_type = block.get("type")
+        block_type = course_tree.block_types[block_index]
 
-        if block_type:
-            counter[block_type] = counter.get(block_type, -1) + 1
-            block['position_number'] = counter[block_type]
+        if block_type not in block_report_filter:
+            return
 
-        for i in range(len(children)):
-            child_id = block['children'][i]
-            child_detail = populate_children(all_blocks[child_id], all_blocks, counter)
-            block['children'][i] = child_detail
+        parents_data = []
 
-        return block
+        for prefix, parent_index in zip(parent_prefixes, parent_indexes):
+            parents_data.append(('{}_name'.format(prefix), course_tree.display_names[parent_index]))
+            parents_data.append(('{}_number'.format(prefix), course_tree.position_numbers[parent_index]))
+
+        report_blocks.append((
+            block_index,
+            block_type,
+            course_tree.display_names[block_index],
+            course_tree.position_numbers[block_index],
+            tuple(parents_data),
+        ))
+
+    for section in course_tree.children[0]:
+        add_report_block(section, ())
+        for subsection in course_tree.children[section]:
+            add_report_block(subsection, (section,))
+            for vertical in course_tree.children[subsection]:
+                add_report_block(vertical, (section, subsection))
+                for component in course_tree.children[vertical]:
+                    add_report_block(component, (section, subsection, vertical))
+
+    return report_blocks
+
+
+def get_cached_root_block(user, course_key):
+    """
+    Returns the CourseTree of the course, built once per published version of the course.
 
+    The tree is kept in a per-process LRU cache and, if OPR_COURSE_TREE_DJANGO_CACHE_TIMEOUT
+    is set, in the Django cache, so the report pages of the same course share the same tree.
+    The version of the course is part of the cache key, so the cached trees are discarded
+    once the course is republished.
+
+    Args:
+        user: django.contrib.auth.models.User instance used to get the course blocks.
+        course_key: Opaque course key object.
+    Returns:
+        CourseTree instance.
+    """
+    cache_key = (str(course_key), get_course_version(course_key))
+    course_tree = COURSE_TREE_CACHE.get(cache_key)
+
+    if course_tree is not None:
+        return course_tree
+
+    django_cache_timeout = getattr(settings, 'OPR_COURSE_TREE_DJANGO_CACHE_TIMEOUT', 0)
+    django_cache_key = '{}.{}'.format(
+        COURSE_TREE_CACHE_KEY_PREFIX,
+        hashlib.md5(repr(cache_key).encode('utf-8')).hexdigest(),
+    )
+
+    if django_cache_timeout:
+        course_tree = cache.get(django_cache_key)
+
+    if course_tree is None:
+        course_tree = get_root_block(user, course_key)
+
+        if django_cache_timeout:
+            cache.set(django_cache_key, course_tree, django_cache_timeout)
+
+    # Drop the trees of the previous versions of the course.
+    for cached_key in COURSE_TREE_CACHE.keys():
+        if cached_key[0] == cache_key[0]:
+            COURSE_TREE_CACHE.delete(cached_key)
+
+    COURSE_TREE_CACHE.set(cache_key, course_tree)
+
+    return course_tree
+
+
+def get_course_version(course_key):
+    """
+    Returns a string that changes every time the course is published.
+
+    The course overview is updated on every course publish, so its last modification
+    date is used as the published version of the course.
+
+    Args:
+        course_key: Opaque course key object.
+    Returns:
+        Version string, or an empty string if the course overview does not exist.
+    """
+    modified = course_overview().objects.filter(id=course_key).values_list('modified', flat=True).first()
+
+    return str(modified) if modified else ''
+
+
+def get_root_block(user, course_key):
+    """
+    Returns the content course as a CourseTree instance.
+    """
     block_types_filter = [
         'course',
         'chapter',
@@ -197,15 +382,6 @@ def get_root_block(user, course_key):
         'word_cloud'
     ]
 
-    requested_fields = [
-        'children',
-        'display_name',
-        'type',
-        'due',
-        'graded',
-        'format'
-    ]
-
     usage_key = get_modulestore().make_course_usage_key(course_key)
     blocks = get_course_blocks(user, usage_key)
 
@@ -218,74 +394,114 @@ def get_root_block(user, course_key):
         for block_key in block_keys_to_remove:
             blocks.remove_block(block_key, keep_descendants=True)
 
-    block_data = {}
-
-    for block_key in blocks:
-        block = {
-            'block_key': block_key,
-            'id': str(block_key),
-            'block_id': str(block_key.block_id),
-            'resume_block': False,
-            'complete': False
-        }
-        for supported_field in get_supported_fields():
-            if supported_field.requested_field_name in requested_fields:
-                field_value = blocks.get_xblock_field(block_key, supported_field.block_field_name)
-                if field_value:
-                    # only return fields that have data
-                    block[supported_field.serializer_field_name] = field_value
+    return compile_course_tree(blocks)
 
-        children = blocks.get_children(block_key)
-        if children:
-            block['children'] = [str(child) for child in children]
 
-        block_data[str(block_key)] = block
+def compile_course_tree(blocks):
+    """
+    Flatten the given block structure into a CourseTree.
 
-    root_block = populate_children(block_data[str(blocks.root_block_usage_key)], block_data)
+    The blocks are stored in pre-order, so the index of a block is always greater
+    than the index of its parent and the root block is stored at index 0.
+    The position number of a block is its place value among the blocks of the same type.
 
-    return root_block
+    Args:
+        blocks: openedx.core.djangoapps.content.block_structure.block_structure.BlockStructure instance.
+    Returns:
+        CourseTree instance.
+    """
+    block_keys = []
+    block_types = []
+    display_names = []
+    position_numbers = []
+    parents = []
+    children = []
+    position_counter = {}
+    pending_blocks = [(blocks.root_block_usage_key, -1)]
+
+    while pending_blocks:
+        block_key, parent_index = pending_blocks.pop()
+        block_index = len(block_keys)
+        block_type = blocks.get_xblock_field(block_key, 'category')
+        position_counter[block_type] = position_counter.get(block_type, -1) + 1
+
+        block_keys.append(block_key)
+        block_types.append(block_type)
+        display_names.append(blocks.get_xblock_field(block_key, 'display_name') or None)
+        position_numbers.append(position_counter[block_type])
+        parents.append(parent_index)
+        children.append([])
+
+        if parent_index >= 0:
+            children[parent_index].append(block_index)
+
+        pending_blocks.extend((child, block_index) for child in reversed(blocks.get_children(block_key)))
+
+    return CourseTree(
+        block_keys=tuple(block_keys),
+        block_types=tuple(block_types),
+        display_names=tuple(display_names),
+        position_numbers=tuple(position_numbers),
+        parents=tuple(parents),
+        children=tuple(tuple(block_children) for block_children in children),
+        completable_children_count=tuple(
+            len([child for child in block_children if block_types[child] not in NOT_COMPLETABLE_BLOCK_TYPES])
+            for block_children in children
+        ),
+    )
 
 
-def mark_blocks_completed(block, user, course_key):
+def get_block_completions_by_user(users, course_key):
     """
-    Walk course tree, marking block completion.
-    Mark 'most recent completed block as 'resume_block'
+    Return the block completions of the given users grouped by user id.
+
+    The completions of all the users are fetched in a single query,
+    instead of two queries per user.
+
+    Args:
+        users: List of django.contrib.auth.models.User instances.
+        course_key: Opaque course key object.
+    Returns:
+        Dict: {
+            user_id: Dict with the completion value per block key.
+        }
     """
-    last_completed_child_position = get_block_completion_model().get_latest_block_completed(user, course_key)
+    block_completions_by_user = {}
 
-    if last_completed_child_position:
-        recurse_mark_complete(
-            course_block_completions=get_block_completion_model().get_learning_context_completions(user, course_key),
-            latest_completion=last_completed_child_position,
-            block=block
-        )
+    for block_completion in get_learning_context_completions_by_users(users, course_key):
+        course_block_completions = block_completions_by_user.setdefault(block_completion.user_id, {})
+        course_block_completions[block_completion.full_block_key] = block_completion.completion
+
+    return block_completions_by_user
 
 
-def recurse_mark_complete(course_block_completions, latest_completion, block):
+def get_completion_state(course_tree, course_block_completions):
     """
-    Helper function to walk course tree dict,
-    marking blocks as 'complete' and 'last_complete'
+    Return the completion state of the user for every block of the course tree.
+
+    A block is complete if it has been completed by the user, or if all its completable
+    children are complete. If the user has not completed any block, nothing is marked.
 
-    If all blocks are complete, mark parent block complete
-    mark parent blocks of 'last_complete' as 'last_complete'
+    Args:
+        course_tree: CourseTree instance.
+        course_block_completions: Dict with the completion value per block key of the user.
+    Returns:
+        bytearray aligned with the course tree blocks, 1 for complete blocks otherwise 0.
     """
-    block_key = block.get('block_key')
-
-    if course_block_completions.get(block_key):
-        block['complete'] = True
-        if block_key == latest_completion.block_key:
-            block['resume_block'] = True
-
-    if block.get('children'):
-        for idx in range(len(block['children'])):
-            recurse_mark_complete(
-                course_block_completions,
-                latest_completion,
-                block=block['children'][idx]
-            )
-            if block['children'][idx]['resume_block'] is True:
-                block['resume_block'] = True
+    completion_state = bytearray(len(course_tree.block_keys))
+
+    if not course_block_completions:
+        return completion_state
+
+    # Walk the blocks backwards so the children are resolved before their parents.
+    for block_index in reversed(range(len(course_tree.block_keys))):
+        block_children = course_tree.children[block_index]
+
+        if course_block_completions.get(course_tree.block_keys[block_index]):
+            completion_state[block_index] = 1
+        elif block_children and sum(
+                completion_state[child] for child in block_children
+        ) == course_tree.completable_children_count[block_index]:
+            completion_state[block_index] = 1
 
-        completable_blocks = [child for child in block['children'] if child['type'] != 'discussion']
-        if len([child['complete'] for child in block['children'] if child['complete']]) == len(completable_blocks):
-            block['complete'] = True
+    return completion_state
@@ -7,13 +7,13 @@ from opaque_keys import InvalidKeyError
 from opaque_keys.edx.keys import CourseKey
 
 from openedx_pearson_reports.serializers import EnrollmentReportSerializer
-from openedx_pearson_reports.edxapp_wrapper.get_course_details import get_course_details
 from openedx_pearson_reports.edxapp_wrapper.get_student_account_library import \
     get_user_salesforce_contact_id
 from openedx_pearson_reports.edxapp_wrapper.get_student_library import (
     get_course_enrollment,
     get_user_profile,
 )
+from openedx_pearson_reports.utils import get_course_metadata
 
 LOG = logging.getLogger(__name__)
 
@@ -34,11 +34,7 @@ class EnrollmentReport(object):
         """
         Returns a List with the enrollments for the given dates.
         """
-        course_details = get_course_details().fetch(self.course_key)
-        course_start_intake_of_intent = '{} {}'.format(
-            course_details.start_date.strftime('%B'),
-            course_details.start_date.strftime('%Y'),
-        )
+        course_start_intake_of_intent = get_course_metadata(self.course_key).intake_of_intent
         enrollment_serializer = EnrollmentReportSerializer(data=kwargs)
         date_data = enrollment_serializer.validated_data if enrollment_serializer.is_valid() else {}
         updated_at = date_data.get('updated_at', '')
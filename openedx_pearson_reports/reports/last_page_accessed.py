@@ -7,8 +7,8 @@ from opaque_keys.edx.keys import CourseKey
 
 from openedx_pearson_reports.edxapp_wrapper.get_completion_models import get_block_completion_model
 from openedx_pearson_reports.edxapp_wrapper.get_course_blocks import get_course_blocks
-from openedx_pearson_reports.edxapp_wrapper.get_course_cohort import get_course_cohort
-from openedx_pearson_reports.edxapp_wrapper.get_course_teams import get_course_teams
+from openedx_pearson_reports.edxapp_wrapper.get_course_cohort import get_course_cohort_names
+from openedx_pearson_reports.edxapp_wrapper.get_course_teams import get_course_team_names
 from openedx_pearson_reports.edxapp_wrapper.get_modulestore import get_modulestore
 
 
@@ -50,38 +50,45 @@ def get_last_page_accessed_data(course_list):
         usage_key = get_modulestore().make_course_usage_key(course_key)
         blocks = get_course_blocks(enrolled_students.first(), usage_key)
 
+        last_completed_positions = []
+
         for user in enrolled_students:
             last_completed_child_position = get_block_completion_model().get_latest_block_completed(
                 user,
                 course_key
             )
+
+            if last_completed_child_position:
+                last_completed_positions.append((user, last_completed_child_position))
+
+        users_with_completions = [user for user, _ in last_completed_positions]
+        cohort_names = get_course_cohort_names(course_key, users_with_completions)
+        team_names = get_course_team_names(course_key, users_with_completions)
+
+        for user, last_completed_child_position in last_completed_positions:
             parent_tree_name = ''
             vertical_block_id = ''
+            vertical_blocks = blocks.topological_traversal(
+                filter_func=lambda block_key: block_key.block_type == 'vertical',
+                yield_descendants_of_unyielded=True,
+            )
 
-            if last_completed_child_position:
-                user_course_cohort = get_course_cohort(user=user, course_key=course_key)
-                user_course_teams = get_course_teams(membership__user=user, course_id=course_key)
-                vertical_blocks = blocks.topological_traversal(
-                    filter_func=lambda block_key: block_key.block_type == 'vertical',
-                    yield_descendants_of_unyielded=True,
-                )
-
-                for vertical in vertical_blocks:
-                    for component in blocks.get_children(vertical):
-                        if component.block_id == last_completed_child_position.block_key.block_id:
-                            parent_tree_name = '-'.join(get_parent_display_names(blocks, component))
-                            component_parent = blocks.get_parents(component)
-                            vertical_block_id = component_parent[0].block_id
-
-                user_data.append({
-                    'username': user.username,
-                    'user_cohort': user_course_cohort.name if user_course_cohort else '',
-                    'user_teams': user_course_teams[0].name if user_course_teams else '',
-                    'last_time_accessed': str(last_completed_child_position.modified),
-                    'last_page_viewed': parent_tree_name,
-                    'block_id': last_completed_child_position.block_key.block_id,
-                    'vertical_block_id': vertical_block_id,
-                })
+            for vertical in vertical_blocks:
+                for component in blocks.get_children(vertical):
+                    if component.block_id == last_completed_child_position.block_key.block_id:
+                        parent_tree_name = '-'.join(get_parent_display_names(blocks, component))
+                        component_parent = blocks.get_parents(component)
+                        vertical_block_id = component_parent[0].block_id
+
+            user_data.append({
+                'username': user.username,
+                'user_cohort': cohort_names.get(user.id, ''),
+                'user_teams': team_names.get(user.id, ''),
+                'last_time_accessed': str(last_completed_child_position.modified),
+                'last_page_viewed': parent_tree_name,
+                'block_id': last_completed_child_position.block_key.block_id,
+                'vertical_block_id': vertical_block_id,
+            })
 
         if user_data:
             last_page_data[course_id] = user_data
@@ -15,12 +15,12 @@ from openedx_pearson_reports.edxapp_wrapper.get_certificates_models import (
     get_certificate_statuses,
     get_certificate_status_for_student
 )
-from openedx_pearson_reports.edxapp_wrapper.get_course_cohort import get_course_cohort
+from openedx_pearson_reports.edxapp_wrapper.get_course_cohort import get_course_cohort_names
 from openedx_pearson_reports.edxapp_wrapper.get_course_grade_library import (
     get_course_grade_factory,
     get_grading_context
 )
-from openedx_pearson_reports.edxapp_wrapper.get_course_teams import get_course_teams
+from openedx_pearson_reports.edxapp_wrapper.get_course_teams import get_course_team_names
 from openedx_pearson_reports.edxapp_wrapper.get_courseware_library import get_course_by_id
 from openedx_pearson_reports.edxapp_wrapper.get_student_library import get_user_profile
 from openedx_pearson_reports.utils import get_enrolled_users
@@ -56,22 +56,22 @@ class LearningTrackerReport(object):
         """
         Returns a List with the metric for every user in the course.
         """
-        enrolled_users = get_enrolled_users(self.course_key)
+        enrolled_users = list(get_enrolled_users(self.course_key))
         report_data = []
 
         if not enrolled_users:
             return report_data
 
-        for user in enrolled_users:
-            cohort = get_course_cohort(user=user, course_key=self.course_key)
-            teams = get_course_teams(membership__user=user, course_id=self.course_key)
+        cohort_names = get_course_cohort_names(self.course_key, enrolled_users)
+        team_names = get_course_team_names(self.course_key, enrolled_users)
 
+        for user in enrolled_users:
             user_data = {
                 'username': user.username,
                 'email': user.email,
                 'user_id': user.id,
-                'team': teams[0].name if teams else '',
-                'cohort': cohort.name if cohort else '',
+                'team': team_names.get(user.id, ''),
+                'cohort': cohort_names.get(user.id, ''),
                 'average_session_length': self._get_average_session_length(user),
                 'cumulative_grade': self._get_cumulative_grade(user),
                 'has_verified_certificate': self._has_verified_certificate(user),
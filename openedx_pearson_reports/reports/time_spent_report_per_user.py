@@ -4,22 +4,24 @@ Module containing the Time spent per user report.
 import logging
 
 from django.conf import settings
-from google.api_core.exceptions import GoogleAPIError
 from google.cloud import bigquery
-from google.cloud.bigquery.client import Client
-from google.oauth2 import service_account
 
 from openedx_pearson_reports.edxapp_wrapper.get_block_structure_library import get_course_in_cache
-from openedx_pearson_reports.edxapp_wrapper.get_course_cohort import get_course_cohort
-from openedx_pearson_reports.edxapp_wrapper.get_course_teams import get_course_teams
+from openedx_pearson_reports.edxapp_wrapper.get_course_cohort import get_course_cohort_names
+from openedx_pearson_reports.edxapp_wrapper.get_course_teams import get_course_team_names
 from openedx_pearson_reports.edxapp_wrapper.get_modulestore import item_not_found_error
+from openedx_pearson_reports.google_services.bigquery_module import (
+    GoogleBigQueryInformationError,
+    get_google_bigquery_data,
+    get_google_bigquery_data_per_key,
+    get_google_bigquery_limit_clause,
+)
 
 
-BIGQUERY_API_SCOPES = (
-    'https://www.googleapis.com/auth/bigquery',
-    'https://www.googleapis.com/auth/cloud-platform',
-    'https://www.googleapis.com/auth/bigquery.readonly',
-)
+# The block id is the last part of the module id,
+# e.g. block-v1:edX+DemoX+Demo_Course+type@vertical+block@vertical_id or edX/DemoX/Demo_Course/vertical/vertical_id
+BLOCK_ID_REGEX = '([^@/]+)/*$'
+TIME_ON_ASSET_COLUMN_NAMES = ('time_umid5', 'time_umid30')
 logger = logging.getLogger(__name__)
 
 
@@ -65,145 +67,275 @@ class GenerateTimeSpentPerUserReport(object):
 
         return deprecated_course_key.replace('/', '_')
 
+    def get_google_bigquery_query(self, parameter_suffix=''):
+        """
+        Return the Google BigQuery query of the course and its parameters.
+
+        Args:
+            parameter_suffix: Suffix of the query parameter names. **Optional**
+        """
+        return get_google_bigquery_query(
+            course_dataset_name=self.get_google_bigquery_course_id(),
+            date=self.query_date,
+            course_id=str(self.course_key),
+            parameter_suffix=parameter_suffix,
+        )
+
     def get_google_bigquery_data(self):
         """
         Return the Google BigQuery data.
 
         Return:
-            google.cloud.bigquery.job.QueryJob.result() instance.
+            google.cloud.bigquery.table.RowIterator instance or an empty list if the query failed.
         """
-        bigquery_client = get_google_bigquery_api_client()
-        query_job = bigquery_client.query(
-            get_google_bigquery_query(
-                course_dataset_name=self.get_google_bigquery_course_id(),
-                date=self.query_date,
-                course_id=str(self.course_key),
-            ),
-            job_config=get_google_bigquery_job_config(),
-        )
+        query_string, query_parameters = self.get_google_bigquery_query()
 
-        try:
-            query_job.exception()
-        except GoogleAPIError as api_error:
-            for error_item in api_error.errors:
-                logger.error('Google BigQuery API error: %s', error_item.get('message', ''))
-                return []
+        return get_google_bigquery_data(query_string, query_parameters=query_parameters)
 
-        if query_job.errors:
-            for error_item in query_job.errors:
-                logger.error('Google BigQuery query error: %s', error_item.get('message', ''))
-                return []
+    def get_vertical_outline(self):
+        """
+        Return the names and positions of the course verticals.
 
-        return query_job.result()
+        The outline is built once per course and shared by all the users of the report.
 
-    def generate_report_data(self):
+        Returns:
+            List of tuples: [(
+                Vertical block id.
+                Tuple with the (key, value) items of the chapter, sequential and vertical names and positions.
+            )]
+        """
+        vertical_outline = []
+        chapter_name = ''
+        chapter_position = 0
+        sequential_name = ''
+        sequential_position = 0
+        vertical_name = ''
+        vertical_position = 0
+
+        for course_block in self.course_blocks:
+            if course_block.block_type == 'chapter':
+                chapter_name = self.course_block_structure.get_xblock_field(
+                    course_block,
+                    'display_name',
+                ) or ''
+                sequential_position = 0
+                chapter_position += 1
+            elif course_block.block_type == 'sequential':
+                sequential_name = self.course_block_structure.get_xblock_field(
+                    course_block,
+                    'display_name',
+                ) or ''
+                sequential_position += 1
+            elif course_block.block_type == 'vertical':
+                vertical_name = self.course_block_structure.get_xblock_field(
+                    course_block,
+                    'display_name',
+                ) or ''
+                # The vertical position must be only incremental.
+                vertical_position += 1
+
+                vertical_outline.append((
+                    course_block.block_id,
+                    (
+                        ('chapter_name', chapter_name),
+                        ('chapter_position', chapter_position),
+                        ('sequential_name', sequential_name),
+                        ('sequential_position', sequential_position),
+                        ('vertical_name', vertical_name),
+                        ('vertical_position', vertical_position),
+                    ),
+                ))
+
+        return vertical_outline
+
+    def has_course_blocks(self):
+        """
+        Return True if the course blocks were found otherwise False.
+        """
+        return bool(self.course_block_structure or self.course_blocks)
+
+    def generate_report_data(self, time_spent_per_vertical=None):
         """
         Return the time spent per user report data.
+
+        Args:
+            time_spent_per_vertical: Optional dict returned by get_time_spent_per_vertical with the
+                                     prefetched Google BigQuery data of the course. If it is not
+                                     provided, the course data is queried.
         """
-        if not (self.course_block_structure or self.course_blocks):
+        if not self.has_course_blocks():
             return []
 
-        time_on_asset_column_name = getattr(
-            settings,
-            'OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_COLUMN_NAME',
-            '',
-        )
-        bigquery_data = list(self.get_google_bigquery_data())
+        if time_spent_per_vertical is None:
+            time_spent_per_vertical = get_time_spent_per_vertical(
+                self.get_google_bigquery_data(),
+                get_time_on_asset_column_name(),
+            )
 
-        if not bigquery_data:
+        if not time_spent_per_vertical:
             return []
 
-        course_blocks = list(self.course_blocks)
+        vertical_outline = self.get_vertical_outline()
+        users = list(self.users)
+        cohort_names = get_course_cohort_names(self.course_key, users)
+        team_names = get_course_team_names(self.course_key, users)
         user_data = []
 
-        for user in self.users:
-            user_course_cohort = get_course_cohort(user=user, course_key=self.course_key)
-            user_course_teams = get_course_teams(membership__user=user, course_id=self.course_key)
+        for user in users:
             block_data = []
-            chapter_name = ''
-            chapter_position = 0
-            sequential_name = ''
-            sequential_position = 0
-            vertical_name = ''
-            vertical_position = 0
-
-            for course_block in course_blocks:
-                bigquery_item = {}
-
-                for item_data in bigquery_data:
-                    if (item_data.get('username', '') == user.username and
-                            course_block.block_id in item_data.get('module_id', '')):
-                        bigquery_item = item_data
-                        break
-
-                if course_block.block_type == 'chapter':
-                    chapter_name = self.course_block_structure.get_xblock_field(
-                        course_block,
-                        'display_name',
-                    ) or ''
-                    sequential_position = 0
-                    chapter_position += 1
-                elif course_block.block_type == 'sequential':
-                    sequential_name = self.course_block_structure.get_xblock_field(
-                        course_block,
-                        'display_name',
-                    ) or ''
-                    sequential_position += 1
-                elif course_block.block_type == 'vertical':
-                    vertical_name = self.course_block_structure.get_xblock_field(
-                        course_block,
-                        'display_name',
-                    ) or ''
-                    # The vertical position must be only incremental.
-                    vertical_position += 1
-
-                    block_data.append({
-                        'average_time_spent': bigquery_item.get(
-                            time_on_asset_column_name,
-                            0,
-                        ) if bigquery_item else 0,
-                        'chapter_name': chapter_name,
-                        'chapter_position': chapter_position,
-                        'sequential_name': sequential_name,
-                        'sequential_position': sequential_position,
-                        'vertical_name': vertical_name,
-                        'vertical_position': vertical_position,
-                    })
+
+            for vertical_block_id, vertical_data in vertical_outline:
+                vertical_block_data = {
+                    'average_time_spent': time_spent_per_vertical.get(
+                        (user.username, vertical_block_id),
+                        0,
+                    ),
+                }
+                vertical_block_data.update(vertical_data)
+                block_data.append(vertical_block_data)
 
             user_data.append({
                 'username': user.username,
-                'user_cohort': user_course_cohort.name if user_course_cohort else '',
-                'user_teams': user_course_teams[0].name if user_course_teams else '',
+                'user_cohort': cohort_names.get(user.id, ''),
+                'user_teams': team_names.get(user.id, ''),
                 'blocks': block_data,
             })
 
         return user_data
 
 
-def get_google_bigquery_api_client():
+def get_time_spent_per_vertical_per_course(reports):
     """
-    Return the Google BigQuery API client.
+    Return the indexed Google BigQuery data of many time spent per user reports.
 
+    The courses are queried together with a UNION ALL query, so the job latency is paid once per
+    batch of OPR_GOOGLE_BIGQUERY_MAX_COURSES_PER_QUERY courses instead of once per course, and the
+    batches run at the same time. The rows are split per course by their course_id value. The byte limit
+    of a batch query is multiplied by its number of courses. If a batch query fails or exceeds that limit,
+    e.g. a course dataset does not exist, the courses of that batch are queried on their own.
+
+    Args:
+        reports: List of GenerateTimeSpentPerUserReport instances with the same query date.
     Returns:
-        google_bigquery_client: google.cloud.bigquery.client.Client instance.
+        Dict: {course id string: {(username, vertical block id): time spent value}}
     """
-    service_account_credentials = getattr(settings, 'OPR_GOOGLE_SERVICE_ACCOUNT_CREDENTIALS', {})
-    google_project_id = getattr(settings, 'OPR_GOOGLE_CLOUD_PROJECT_ID', '')
-
-    if not (service_account_credentials or google_project_id):
-        logger.error('Google Service Account credentials or porject ID were not provided.')
-        raise GoogleBigQueryInformationError('Google Service Account credentials or porject ID were not provided.')
+    time_on_asset_column_name = get_time_on_asset_column_name()
+    batch_size = getattr(settings, 'OPR_GOOGLE_BIGQUERY_MAX_COURSES_PER_QUERY', 20) or 1
+    reports = [report for report in reports if report.has_course_blocks()]
+    report_batches = [reports[index:index + batch_size] for index in range(0, len(reports), batch_size)]
+    time_spent_per_course = {}
+    failed_reports = []
+
+    batch_results = get_google_bigquery_data_per_key(
+        queries={
+            batch_index: get_google_bigquery_batch_query([
+                report.get_google_bigquery_query(parameter_suffix='_{}'.format(report_index))
+                for report_index, report in enumerate(batch_reports)
+            ]) for batch_index, batch_reports in enumerate(report_batches)
+        },
+        process_rows=lambda bigquery_data: get_time_spent_per_vertical_per_course_id(
+            bigquery_data,
+            time_on_asset_column_name,
+        ),
+        query_weights={
+            batch_index: len(batch_reports) for batch_index, batch_reports in enumerate(report_batches)
+        },
+    )
 
-    credentials = service_account.Credentials.from_service_account_info(
-        service_account_credentials,
-        scopes=BIGQUERY_API_SCOPES,
+    for batch_index, batch_reports in enumerate(report_batches):
+        if batch_index not in batch_results:
+            failed_reports.extend(batch_reports)
+            continue
+
+        for report in batch_reports:
+            course_id = str(report.course_key)
+            time_spent_per_course[course_id] = batch_results[batch_index].get(course_id, {})
+
+    if not failed_reports:
+        return time_spent_per_course
+
+    logger.warning('A batch query failed, its courses are queried on their own.')
+    course_results = get_google_bigquery_data_per_key(
+        queries={str(report.course_key): report.get_google_bigquery_query() for report in failed_reports},
+        process_rows=lambda bigquery_data: get_time_spent_per_vertical(
+            bigquery_data,
+            time_on_asset_column_name,
+        ),
     )
 
-    return Client(
-        project=google_project_id,
-        credentials=credentials,
+    for report in failed_reports:
+        course_id = str(report.course_key)
+        time_spent_per_course[course_id] = course_results.get(course_id, {})
+
+    return time_spent_per_course
+
+
+def get_time_spent_per_vertical_per_course_id(bigquery_data, time_on_asset_column_name):
+    """
+    Index the Google BigQuery rows of many courses by course id, username and vertical block id.
+
+    Args:
+        bigquery_data: Iterable of the Google BigQuery rows.
+        time_on_asset_column_name: Name of the time on asset column to get the time spent value.
+    Returns:
+        Dict: {course id string: {(username, vertical block id): time spent value}}
+    """
+    time_spent_per_course_id = {}
+
+    for item_data in bigquery_data:
+        add_time_spent_item(
+            time_spent_per_course_id.setdefault(item_data.get('course_id', ''), {}),
+            item_data,
+            time_on_asset_column_name,
+        )
+
+    return time_spent_per_course_id
+
+
+def get_time_on_asset_column_name():
+    """
+    Return the name of the time on asset column used for the time spent values.
+    """
+    return getattr(settings, 'OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_COLUMN_NAME', '')
+
+
+def get_time_spent_per_vertical(bigquery_data, time_on_asset_column_name):
+    """
+    Index the Google BigQuery rows by username and vertical block id.
+
+    If there are many rows for the same username and block id, the first one is used.
+
+    Args:
+        bigquery_data: Iterable of the Google BigQuery rows.
+        time_on_asset_column_name: Name of the time on asset column to get the time spent value.
+    Returns:
+        Dict: {(username, vertical block id): time spent value}
+    """
+    time_spent_per_vertical = {}
+
+    for item_data in bigquery_data:
+        add_time_spent_item(time_spent_per_vertical, item_data, time_on_asset_column_name)
+
+    return time_spent_per_vertical
+
+
+def add_time_spent_item(time_spent_per_vertical, item_data, time_on_asset_column_name):
+    """
+    Add the time spent value of a Google BigQuery row to the given index if its key is not there yet.
+
+    Args:
+        time_spent_per_vertical: Dict {(username, vertical block id): time spent value} to update.
+        item_data: Google BigQuery row.
+        time_on_asset_column_name: Name of the time on asset column to get the time spent value.
+    """
+    item_key = (
+        item_data.get('username', ''),
+        item_data.get('block_id', ''),
     )
 
+    if item_key not in time_spent_per_vertical:
+        time_spent_per_vertical[item_key] = item_data.get(time_on_asset_column_name, 0)
+
 
 def block_type_filter(block_item):
     """
@@ -222,62 +354,92 @@ def block_type_filter(block_item):
     return block_item.block_type in block_type_whitelist
 
 
-def get_google_bigquery_job_config():
+def get_google_bigquery_query(course_dataset_name, date, course_id, parameter_suffix=''):
     """
-    Return the Google BigQuery job configuration.
-
-    Returns:
-        job_config: google.cloud.bigquery.job.QueryJobConfig instance.
-    """
-    job_config = bigquery.QueryJobConfig()
-    job_config.maximum_bytes_billed = getattr(settings, 'OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES', None)
-    job_config.use_query_cache = getattr(settings, 'OPR_GOOGLE_BIGQUERY_USE_CACHE', False)
-
-    return job_config
+    Return the Google BigQuery query for the time_on_asset_daily table.
 
+    The rows are aggregated by Google BigQuery into one row per username and vertical block id,
+    with the sum of the OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_COLUMN_NAME column, so only that column is read
+    and transferred. The date is compared directly, so Google BigQuery can prune the table partitions when the
+    date column is a partitioned DATE column, see OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_DATE_TYPE.
 
-def get_google_bigquery_query(course_dataset_name, date, course_id):
-    """
-    Return the Google BigQuery query for the time_on_asset_daily table.
+    The course id and the date are sent as query parameters, so equivalent queries can reuse
+    the Google BigQuery cache. The dataset name is part of the table name and can't be a parameter.
 
     Args:
         course_dataset_name: Dataset name where the table is stored.
         date: Date to filter the query. Date format: '%Y-%m-%d' e.g. '2019-01-01'
         course_id: Course id string.
+        parameter_suffix: Suffix of the query parameter names, to combine many queries in one job. **Optional**
     Returns:
         query_string: The query string to make the query.
+        query_parameters: List of google.cloud.bigquery.ScalarQueryParameter instances.
     Raises:
         GoogleBigQueryInformationError: If OPR_GOOGLE_CLOUD_PROJECT_ID or course_dataset_name
-                                        were not provided or are None.
+                                        were not provided or are None, or if the time on asset
+                                        column name is not supported.
     """
     google_project_id = getattr(settings, 'OPR_GOOGLE_CLOUD_PROJECT_ID', '')
-    query_max_result_number = getattr(settings, 'OPR_GOOGLE_BIGQUERY_MAX_NUMBER_RESULTS_PER_QUERY', 1000)
+    time_on_asset_column_name = get_time_on_asset_column_name()
 
     if not (google_project_id or course_dataset_name):
         raise GoogleBigQueryInformationError('Google cloud project id or course_dataset_name are missing.')
 
+    if time_on_asset_column_name not in TIME_ON_ASSET_COLUMN_NAMES:
+        raise GoogleBigQueryInformationError(
+            'Time on asset column name {} is not supported.'.format(time_on_asset_column_name),
+        )
+
     query_string = """
-        SELECT course_id, username, module_id, time_umid5, time_umid30
+        SELECT
+            course_id,
+            username,
+            REGEXP_EXTRACT(module_id, '{block_id_regex}') AS block_id,
+            SUM({time_on_asset_column_name}) AS {time_on_asset_column_name}
         FROM `{google_project_id}.{bigquery_dataset}.time_on_asset_daily`
-        WHERE module_id LIKE '%vertical%'
-        AND course_id = '{course_id}'
-        AND time_umid5 IS NOT NULL
-        AND time_umid30 IS NOT NULL
-        AND PARSE_DATETIME('%Y-%m-%d', date) = '{query_date}' LIMIT {max_result_number}
+        WHERE date = @query_date{parameter_suffix}
+        AND course_id = @course_id{parameter_suffix}
+        AND module_id LIKE '%vertical%'
+        AND {time_on_asset_column_name} IS NOT NULL
+        GROUP BY course_id, username, block_id {limit_clause}
     """.format(
+        block_id_regex=BLOCK_ID_REGEX,
+        time_on_asset_column_name=time_on_asset_column_name,
         google_project_id=google_project_id,
         bigquery_dataset=course_dataset_name,
-        course_id=course_id,
-        query_date=date,
-        max_result_number=query_max_result_number,
+        parameter_suffix=parameter_suffix,
+        limit_clause=get_google_bigquery_limit_clause(),
     )
+    query_parameters = [
+        bigquery.ScalarQueryParameter('course_id{}'.format(parameter_suffix), 'STRING', course_id),
+        bigquery.ScalarQueryParameter(
+            'query_date{}'.format(parameter_suffix),
+            getattr(settings, 'OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_DATE_TYPE', 'STRING'),
+            date,
+        ),
+    ]
 
-    return query_string
+    return query_string, query_parameters
 
 
-class GoogleBigQueryInformationError(Exception):
+def get_google_bigquery_batch_query(queries):
     """
-    Exception class raised when some of the required information
-    by Google BigQuery were not provided.
+    Return a single Google BigQuery query that joins the given queries with UNION ALL.
+
+    Every query is wrapped in a subquery, so its LIMIT clause only applies to its own course.
+
+    Args:
+        queries: List of the (query string, query parameters) tuples returned by get_google_bigquery_query.
+                 The parameter names must be unique across the queries.
+    Returns:
+        query_string: The query string to make the query.
+        query_parameters: List of google.cloud.bigquery.ScalarQueryParameter instances.
     """
-    pass
+    query_string = '\nUNION ALL\n'.join(
+        'SELECT * FROM ({})'.format(query_string) for query_string, _ in queries
+    )
+    query_parameters = [
+        query_parameter for _, parameters in queries for query_parameter in parameters
+    ]
+
+    return query_string, query_parameters
@@ -69,10 +69,21 @@ def plugin_settings(settings):
     settings.OPR_COURSE_DETAILS = 'openedx_pearson_reports.edxapp_wrapper.backends.course_details_g_v1'
     settings.OPR_GOOGLE_SERVICE_ACCOUNT_CREDENTIALS = {}
     settings.OPR_GOOGLE_CLOUD_PROJECT_ID = ''
+    settings.OPR_ANALYTICS_BACKEND = 'bigquery'  # 'bigquery' or 'sqlite' to use a local time_on_asset_daily table.
+    settings.OPR_ANALYTICS_SQLITE_DATABASE_PATH = ''
     settings.OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES = 10485760  # 10MB
-    settings.OPR_GOOGLE_BIGQUERY_MAX_NUMBER_RESULTS_PER_QUERY = 1000
+    settings.OPR_GOOGLE_BIGQUERY_MAX_NUMBER_RESULTS_PER_QUERY = None  # None means the results are not limited.
+    settings.OPR_GOOGLE_BIGQUERY_PAGE_SIZE = 1000
+    settings.OPR_GOOGLE_BIGQUERY_MAX_COURSES_PER_QUERY = 20
+    settings.OPR_GOOGLE_BIGQUERY_MAX_CONCURRENT_JOBS = 8
     settings.OPR_GOOGLE_BIGQUERY_USE_CACHE = True
+    settings.OPR_GOOGLE_BIGQUERY_DRY_RUN = False
+    settings.OPR_GOOGLE_BIGQUERY_RESULT_CACHE_TIMEOUT = 600  # This value is in seconds, 0 disables the result cache.
+    settings.OPR_GOOGLE_BIGQUERY_RESULT_CACHE_LOCK_TIMEOUT = 300  # This value is in seconds.
+    settings.OPR_GOOGLE_BIGQUERY_RESULT_CACHE_MAX_BYTES = 1000000  # Memcached default item size limit is 1MB.
+    settings.OPR_GOOGLE_BIGQUERY_RESULT_LOCAL_CACHE_SIZE = 8
     settings.OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_COLUMN_NAME = 'time_umid30'
+    settings.OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_DATE_TYPE = 'STRING'  # 'DATE' if the date column is a DATE.
     settings.OPR_SUPPORTED_REPORTS_BACKENDS = {
         'generate_enrollment_per_site_report': {
             'backend': 'openedx_pearson_reports.reports.backend.enrollment_per_site_report:EnrollmentReportPerSiteBackend',
@@ -86,3 +97,10 @@ def plugin_settings(settings):
     settings.OPR_DEFAULT_PAGE_RESULTS_LIMIT = 10
     settings.OPR_COURSE_CONTENT = 'openedx_pearson_reports.edxapp_wrapper.backends.course_content_i_v1'
     settings.OPR_OPENEDX_AUTHENTICATION = 'openedx_pearson_reports.edxapp_wrapper.backends.openedx_authentication_j_v1'
+    settings.OPR_COURSE_TREE_CACHE_SIZE = 32
+    settings.OPR_COURSE_TREE_CACHE_TIMEOUT = 3600  # This value is in seconds.
+    settings.OPR_COURSE_TREE_DJANGO_CACHE_TIMEOUT = 0  # This value is in seconds, 0 disables the Django cache.
+    settings.OPR_USER_ACTIVITY_COMPLETION_CHUNK_SIZE = 50
+    settings.OPR_REGISTERED_USERS_CACHE_TIMEOUT = 0  # This value is in seconds, 0 disables the cache.
+    settings.OPR_COURSE_METADATA_CACHE_SIZE = 128
+    settings.OPR_COURSE_METADATA_CACHE_TIMEOUT = 3600  # This value is in seconds.
@@ -119,6 +119,16 @@ def plugin_settings(settings):
         settings.OPR_GOOGLE_CLOUD_PROJECT_ID,
     )
 
+    settings.OPR_ANALYTICS_BACKEND = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_ANALYTICS_BACKEND',
+        settings.OPR_ANALYTICS_BACKEND,
+    )
+
+    settings.OPR_ANALYTICS_SQLITE_DATABASE_PATH = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_ANALYTICS_SQLITE_DATABASE_PATH',
+        settings.OPR_ANALYTICS_SQLITE_DATABASE_PATH,
+    )
+
     settings.OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES = getattr(settings, 'ENV_TOKENS', {}).get(
         'OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES',
         settings.OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES,
@@ -129,16 +139,61 @@ def plugin_settings(settings):
         settings.OPR_GOOGLE_BIGQUERY_MAX_NUMBER_RESULTS_PER_QUERY,
     )
 
+    settings.OPR_GOOGLE_BIGQUERY_PAGE_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_GOOGLE_BIGQUERY_PAGE_SIZE',
+        settings.OPR_GOOGLE_BIGQUERY_PAGE_SIZE,
+    )
+
+    settings.OPR_GOOGLE_BIGQUERY_MAX_COURSES_PER_QUERY = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_GOOGLE_BIGQUERY_MAX_COURSES_PER_QUERY',
+        settings.OPR_GOOGLE_BIGQUERY_MAX_COURSES_PER_QUERY,
+    )
+
+    settings.OPR_GOOGLE_BIGQUERY_MAX_CONCURRENT_JOBS = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_GOOGLE_BIGQUERY_MAX_CONCURRENT_JOBS',
+        settings.OPR_GOOGLE_BIGQUERY_MAX_CONCURRENT_JOBS,
+    )
+
     settings.OPR_GOOGLE_BIGQUERY_USE_CACHE = getattr(settings, 'ENV_TOKENS', {}).get(
         'OPR_GOOGLE_BIGQUERY_USE_CACHE',
         settings.OPR_GOOGLE_BIGQUERY_USE_CACHE,
     )
 
+    settings.OPR_GOOGLE_BIGQUERY_DRY_RUN = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_GOOGLE_BIGQUERY_DRY_RUN',
+        settings.OPR_GOOGLE_BIGQUERY_DRY_RUN,
+    )
+
+    settings.OPR_GOOGLE_BIGQUERY_RESULT_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_GOOGLE_BIGQUERY_RESULT_CACHE_TIMEOUT',
+        settings.OPR_GOOGLE_BIGQUERY_RESULT_CACHE_TIMEOUT,
+    )
+
+    settings.OPR_GOOGLE_BIGQUERY_RESULT_CACHE_LOCK_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_GOOGLE_BIGQUERY_RESULT_CACHE_LOCK_TIMEOUT',
+        settings.OPR_GOOGLE_BIGQUERY_RESULT_CACHE_LOCK_TIMEOUT,
+    )
+
+    settings.OPR_GOOGLE_BIGQUERY_RESULT_CACHE_MAX_BYTES = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_GOOGLE_BIGQUERY_RESULT_CACHE_MAX_BYTES',
+        settings.OPR_GOOGLE_BIGQUERY_RESULT_CACHE_MAX_BYTES,
+    )
+
+    settings.OPR_GOOGLE_BIGQUERY_RESULT_LOCAL_CACHE_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_GOOGLE_BIGQUERY_RESULT_LOCAL_CACHE_SIZE',
+        settings.OPR_GOOGLE_BIGQUERY_RESULT_LOCAL_CACHE_SIZE,
+    )
+
     settings.OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_COLUMN_NAME = getattr(settings, 'ENV_TOKENS', {}).get(
         'OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_COLUMN_NAME',
         settings.OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_COLUMN_NAME,
     )
 
+    settings.OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_DATE_TYPE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_DATE_TYPE',
+        settings.OPR_GOOGLE_BIGQUERY_TIME_ON_ASSET_DAILY_DATE_TYPE,
+    )
+
     settings.OPR_SUPPORTED_REPORTS_BACKENDS = getattr(settings, 'ENV_TOKENS', {}).get(
         'OPR_SUPPORTED_REPORTS_BACKENDS',
         settings.OPR_SUPPORTED_REPORTS_BACKENDS,
@@ -158,3 +213,38 @@ def plugin_settings(settings):
         'OPR_OPENEDX_AUTHENTICATION',
         settings.OPR_OPENEDX_AUTHENTICATION,
     )
+
+    settings.OPR_COURSE_TREE_CACHE_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_COURSE_TREE_CACHE_SIZE',
+        settings.OPR_COURSE_TREE_CACHE_SIZE,
+    )
+
+    settings.OPR_COURSE_TREE_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_COURSE_TREE_CACHE_TIMEOUT',
+        settings.OPR_COURSE_TREE_CACHE_TIMEOUT,
+    )
+
+    settings.OPR_COURSE_TREE_DJANGO_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_COURSE_TREE_DJANGO_CACHE_TIMEOUT',
+        settings.OPR_COURSE_TREE_DJANGO_CACHE_TIMEOUT,
+    )
+
+    settings.OPR_USER_ACTIVITY_COMPLETION_CHUNK_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_USER_ACTIVITY_COMPLETION_CHUNK_SIZE',
+        settings.OPR_USER_ACTIVITY_COMPLETION_CHUNK_SIZE,
+    )
+
+    settings.OPR_REGISTERED_USERS_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_REGISTERED_USERS_CACHE_TIMEOUT',
+        settings.OPR_REGISTERED_USERS_CACHE_TIMEOUT,
+    )
+
+    settings.OPR_COURSE_METADATA_CACHE_SIZE = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_COURSE_METADATA_CACHE_SIZE',
+        settings.OPR_COURSE_METADATA_CACHE_SIZE,
+    )
+
+    settings.OPR_COURSE_METADATA_CACHE_TIMEOUT = getattr(settings, 'ENV_TOKENS', {}).get(
+        'OPR_COURSE_METADATA_CACHE_TIMEOUT',
+        settings.OPR_COURSE_METADATA_CACHE_TIMEOUT,
+    )
@@ -2,6 +2,7 @@
 Task for Openedx Pearson Report plugin.
 """
 import json
+from collections import OrderedDict
 from datetime import datetime
 
 from celery import task
@@ -12,8 +13,11 @@ from opaque_keys import InvalidKeyError
 from opaque_keys.edx.keys import CourseKey
 from rest_framework import status
 
-from openedx_pearson_reports.edxapp_wrapper.get_course_content import course_overview
-from openedx_pearson_reports.reports.activity_completion_report import GenerateCompletionReport
+from openedx_pearson_reports.google_services.bigquery_module import GoogleBigQueryQueryCostError
+from openedx_pearson_reports.reports.activity_completion_report import (
+    GenerateCompletionReport,
+    get_users_activity_completion_data,
+)
 from openedx_pearson_reports.reports.backend.enrollment_per_site_report import generate_enrollment_per_site_report
 from openedx_pearson_reports.reports.completion_report import generate_completion_report
 from openedx_pearson_reports.reports.enrollment_report import EnrollmentReport
@@ -24,9 +28,12 @@ from openedx_pearson_reports.reports.last_page_accessed import (
 from openedx_pearson_reports.reports.learning_tracker_report import LearningTrackerReport
 from openedx_pearson_reports.reports.last_login_report import LastLoginReport
 from openedx_pearson_reports.reports.time_spent_report import get_time_spent_report_data
-from openedx_pearson_reports.reports.time_spent_report_per_user import GenerateTimeSpentPerUserReport
+from openedx_pearson_reports.reports.time_spent_report_per_user import (
+    GenerateTimeSpentPerUserReport,
+    get_time_spent_per_vertical_per_course,
+)
 from openedx_pearson_reports.serializers import ActivityCompletionReportSerializer
-from openedx_pearson_reports.utils import get_enrolled_users
+from openedx_pearson_reports.utils import get_course_metadata, get_enrolled_users, get_exisiting_users_by_email
 
 
 @task(default_retry_delay=5, max_retries=5)  # pylint: disable=not-callable
@@ -38,6 +45,9 @@ def generate_completion_report_task(*args, **kwargs):
         course_key: Course id string.
         enrolled_users: List of the enrolled users in the course.
         extra_data: Contains extra data passed from the report backend.
+            block_report_filter: List of block types to include in the report.
+            output_format: 'compact' to return the data of
+                           completion_report.generate_report_as_compact_data instead.
     Returns:
         List of users containing: {
             cohort: User cohort name.
@@ -55,12 +65,13 @@ def generate_completion_report_task(*args, **kwargs):
             username: Username value.
         }
     """
-    block_report_filter = kwargs.pop('extra_data', {}).get('block_report_filter', [])
+    extra_data = kwargs.pop('extra_data', {})
 
     return generate_completion_report(
         course_key=CourseKey.from_string(kwargs.get('course_key', '')),
         enrolled_users=kwargs.pop('enrolled_users', []),
-        block_report_filter=block_report_filter,
+        block_report_filter=extra_data.get('block_report_filter', []),
+        output_format=extra_data.get('output_format', ''),
     )
 
 
@@ -178,7 +189,7 @@ def generate_activity_completion_report(courses, *args, **kwargs):
 
         course_key = CourseKey.from_string(course_id)
         completion_report = GenerateCompletionReport(
-            get_enrolled_users(course_key),
+            get_enrolled_users(course_key).select_related('profile'),
             course_key,
             required_block_ids,
             block_types,
@@ -189,6 +200,63 @@ def generate_activity_completion_report(courses, *args, **kwargs):
     return data
 
 
+@task(default_retry_delay=5, max_retries=5)  # pylint: disable=not-callable
+def generate_user_activity_completion_data_chunk(*args, **kwargs):
+    """
+    Return the activity completion data for a chunk of users.
+
+    kwargs:
+        Same payload of the user-activity-completion-data API endpoint.
+    Returns:
+        Dict: {
+            user email: {
+                course id: Activity completion data of the user in the course.
+            }
+        }
+    """
+    serialized_data = ActivityCompletionReportSerializer(data=kwargs)
+
+    if not serialized_data.is_valid():
+        raise InvalidTaskError(
+            json.dumps({
+                'data': {
+                    'status': FAILURE,
+                    'result': serialized_data.errors,
+                },
+                'status': status.HTTP_400_BAD_REQUEST,
+            })
+        )
+
+    return get_users_activity_completion_data(
+        user_list=get_exisiting_users_by_email(serialized_data.data.get('users', []), include_profile=True),
+        course_keys=serialized_data.data.get('course_keys', []),
+        block_types=serialized_data.data.get('block_types', []),
+        passing_score=serialized_data.data.get('passing_score', 0),
+    )
+
+
+@task(default_retry_delay=5, max_retries=5)  # pylint: disable=not-callable
+def merge_user_activity_completion_data(chunk_results, *args, **kwargs):
+    """
+    Merge the results of generate_user_activity_completion_data_chunk.
+
+    Args:
+        chunk_results: List with the result of every chunk, in the requested users order.
+    Returns:
+        The same data of the user-activity-completion-data API endpoint response.
+    """
+    completion_data = {}
+
+    for chunk_result in chunk_results:
+        completion_data.update(chunk_result)
+
+    return {
+        'result': {
+            'users': completion_data,
+        }
+    }
+
+
 @task(default_retry_delay=5, max_retries=5)  # pylint: disable=not-callable
 def generate_time_spent_per_user_report(courses, *args, **kwargs):
     """
@@ -216,18 +284,29 @@ def generate_time_spent_per_user_report(courses, *args, **kwargs):
             }),
         )
 
+    time_spent_per_user_reports = OrderedDict()
+
     for course_id in courses:
         try:
             course_key = CourseKey.from_string(course_id)
         except InvalidKeyError:
             continue
 
-        time_spent_per_user_report = GenerateTimeSpentPerUserReport(
+        time_spent_per_user_reports[course_id] = GenerateTimeSpentPerUserReport(
             users=get_enrolled_users(course_key),
             course_key=course_key,
             query_date=date_field.strftime(date_format),
         )
-        report_data[course_id] = time_spent_per_user_report.generate_report_data()
+
+    try:
+        time_spent_per_course = get_time_spent_per_vertical_per_course(time_spent_per_user_reports.values())
+    except GoogleBigQueryQueryCostError as cost_error:
+        raise_google_bigquery_cost_error(cost_error)
+
+    for course_id, time_spent_per_user_report in time_spent_per_user_reports.items():
+        report_data[course_id] = time_spent_per_user_report.generate_report_data(
+            time_spent_per_vertical=time_spent_per_course.get(str(time_spent_per_user_report.course_key)),
+        )
 
     return report_data
 
@@ -251,19 +330,20 @@ def enrollment_per_site_report_task(*args, **kwargs):
     """
     extra_data = kwargs.pop('extra_data', {})
     course_key = CourseKey.from_string(kwargs.get('course_key', ''))
-    report_data = generate_enrollment_per_site_report(
-        course_key=course_key,
-        enrolled_users=kwargs.pop('enrolled_users', []),
-    )
-    course_object = course_overview().get_from_id(
-        course_id=course_key,
-    )
+
+    try:
+        report_data = generate_enrollment_per_site_report(
+            course_key=course_key,
+            enrolled_users=kwargs.pop('enrolled_users', []),
+        )
+    except GoogleBigQueryQueryCostError as cost_error:
+        raise_google_bigquery_cost_error(cost_error)
 
     return {
         'site': extra_data.get('site_name', ''),
         'registered_users': extra_data.get('registered_users', 0),
         'course_key': kwargs.get('course_key', ''),
-        'course': course_object.display_name if course_object else '',
+        'course': get_course_metadata(course_key).display_name,
         'data': report_data,
     }
 
@@ -287,3 +367,24 @@ def generate_last_login_report(courses, *args, **kwargs):
             data[course] = ['Invalid course id value.']
 
     return data
+
+
+def raise_google_bigquery_cost_error(cost_error):
+    """
+    Raise the InvalidTaskError containing the JsonResponse parameters of a query that exceeds
+    OPR_GOOGLE_BIGQUERY_MAX_PROCESS_BYTES, to be used in the view.
+
+    Args:
+        cost_error: GoogleBigQueryQueryCostError instance.
+    Raises:
+        InvalidTaskError
+    """
+    raise InvalidTaskError(
+        json.dumps({
+            'data': {
+                'status': FAILURE,
+                'result': str(cost_error),
+            },
+            'status': status.HTTP_400_BAD_REQUEST,
+        }),
+    )
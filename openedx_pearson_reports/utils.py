@@ -5,14 +5,24 @@ Utils file for Openedx Pearson Reports.
 """
 import copy
 import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
 from importlib import import_module
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Prefetch
 
+from openedx_pearson_reports.edxapp_wrapper.get_course_content import course_overview
 from openedx_pearson_reports.edxapp_wrapper.get_student_library import course_access_role, get_course_enrollment
 
 logger = logging.getLogger(__name__)
+CourseMetadata = namedtuple('CourseMetadata', ['display_name', 'start', 'intake_of_intent'])
+SINGLE_FLIGHT_POLL_INTERVAL = 0.5  # This value is in seconds.
+SINGLE_FLIGHT_UNCACHEABLE_MARKER = 'openedx_pearson_reports.single_flight.uncacheable'
+USERS_BY_EMAIL_CHUNK_SIZE = 500
 
 
 def get_staff_user(course_key):
@@ -56,6 +66,29 @@ def get_user_role(user, course_key):
     return user_role
 
 
+def get_user_roles(user_ids, course_key):
+    """
+    Returns the string roles of the given users with a single query.
+    The users without a course_access_role have the default 'student' role, so they are not in the dict.
+
+    Args:
+        user_ids: List of user ids.
+        course_key: Course key string.
+    Returns:
+        Dict: {user_id: role string}
+    """
+    user_roles = {}
+    course_roles = course_access_role().objects.filter(
+        user_id__in=user_ids,
+        course_id=course_key,
+    ).order_by('id').values_list('user_id', 'role')
+
+    for user_id, role in course_roles:
+        user_roles.setdefault(user_id, []).append(role)
+
+    return {user_id: '-'.join(roles) for user_id, roles in user_roles.items()}
+
+
 def get_enrolled_users(course_key, include_staff_users=False):
     """
     Return all the enrolled users for the given course key.
@@ -94,23 +127,58 @@ def get_attribute_from_module(module, attribute_name):
     return getattr(module, attribute_name, None)
 
 
-def get_exisiting_users_by_email(user_email_list):
+def get_exisiting_users_by_email(user_email_list, include_profile=False, include_active_enrollments=False):
     """
     Return a list of django.contrib.auth.models.User instances of users
-    that exists in the platform.
+    that exists in the platform, in the same order of the given emails.
+
+    The users are fetched with chunked email__in queries instead of one query per email.
+    They are matched by their exact stored email first and then case-insensitively, because the
+    LMS database compares the emails case-insensitively, like User.objects.get(email=...) does there.
+    The entries that are not strings are ignored.
 
     Args:
         user_email_list: List containing the emails of the users.
+        include_profile: True to fetch the UserProfile of the users in the same query.
+            The profile is available in user.profile.
+        include_active_enrollments: True to prefetch the active course enrollments of the users.
+            The enrollments are available in user.active_enrollments.
     Returns:
         exisiting_user_list: List containing django.contrib.auth.models.User instances.
     """
+    user_email_list = [user_email for user_email in user_email_list if isinstance(user_email, str)]
+    # Remove the duplicated emails keeping the order.
+    unique_email_list = list(OrderedDict.fromkeys(user_email_list))
+    users_queryset = User.objects.all()
+    users_by_email = {}
+    users_by_lowercase_email = {}
+
+    if include_profile:
+        users_queryset = users_queryset.select_related('profile')
+
+    if include_active_enrollments:
+        users_queryset = users_queryset.prefetch_related(
+            Prefetch(
+                'courseenrollment_set',
+                queryset=get_course_enrollment().objects.filter(is_active=True),
+                to_attr='active_enrollments',
+            ),
+        )
+
+    for cursor_index in range(0, len(unique_email_list), USERS_BY_EMAIL_CHUNK_SIZE):
+        email_chunk = unique_email_list[cursor_index:cursor_index + USERS_BY_EMAIL_CHUNK_SIZE]
+
+        for user in users_queryset.filter(email__in=email_chunk):
+            users_by_email[user.email] = user
+            users_by_lowercase_email.setdefault(user.email.lower(), user)
+
     exisiting_user_list = []
 
     for user_email in user_email_list:
-        try:
-            exisiting_user_list.append(User.objects.get(email=user_email))
-        except User.DoesNotExist:
-            continue
+        user = users_by_email.get(user_email) or users_by_lowercase_email.get(user_email.lower())
+
+        if user:
+            exisiting_user_list.append(user)
 
     return exisiting_user_list
 
@@ -195,3 +263,175 @@ def get_report_backend(requested_report_name):
         report_backend = None
 
     return report_backend, report_backend_settings
+
+
+def get_or_set_cache_single_flight(cache_key, get_value, timeout, lock_timeout, max_size=None):
+    """
+    Return the value of the given key from the Django cache, computing it once if it is missing.
+
+    Only one caller computes the value at the same time. The other callers wait until the value
+    is stored in the cache, or until lock_timeout is reached and then they compute it themselves.
+    The value is not stored if get_value raises an exception, or if it is longer than max_size,
+    e.g. because memcached silently drops the items bigger than its item size limit. In that case
+    a small marker is stored instead, so the waiting and the next callers compute the value
+    themselves at the same time instead of one after another.
+
+    Args:
+        cache_key: Django cache key string.
+        get_value: Callable without arguments that returns the value to store. The value can't be None.
+        timeout: Number of seconds the value is stored in the cache.
+        lock_timeout: Maximum number of seconds to wait for another caller computing the value.
+        max_size: Maximum length of the value to store, e.g. the number of bytes of a bytes value. **Optional**
+    Returns:
+        The cached or computed value.
+    """
+    lock_key = '{}.lock'.format(cache_key)
+    wait_until = time.time() + lock_timeout
+    lock_acquired = False
+
+    while True:
+        value = cache.get(cache_key)
+
+        if value == SINGLE_FLIGHT_UNCACHEABLE_MARKER:
+            return get_value()
+
+        if value is not None:
+            return value
+
+        lock_acquired = cache.add(lock_key, True, lock_timeout)
+
+        if lock_acquired or time.time() >= wait_until:
+            break
+
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+
+    try:
+        value = get_value()
+
+        if max_size and len(value) > max_size:
+            logger.warning(
+                'The value of %s was not cached, its size %s exceeds the limit of %s.',
+                cache_key,
+                len(value),
+                max_size,
+            )
+            cache.set(cache_key, SINGLE_FLIGHT_UNCACHEABLE_MARKER, timeout)
+        else:
+            cache.set(cache_key, value, timeout)
+    finally:
+        if lock_acquired:
+            cache.delete(lock_key)
+
+    return value
+
+
+class LRUCache(object):
+    """
+    Thread safe in-process cache with least recently used eviction.
+
+    Every worker process keeps its own copy of the data, so it is intended for
+    small values that are expensive to build and are requested many times.
+    """
+
+    def __init__(self, max_size, timeout=None):
+        """
+        Args:
+            max_size: Maximum number of entries to keep.
+            timeout: Number of seconds an entry is valid. None means no expiration.
+        """
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the value for the given key, or the default value if it is missing or expired.
+        """
+        with self._lock:
+            try:
+                value, expires_at = self._data.pop(key)
+            except KeyError:
+                return default
+
+            if expires_at is not None and expires_at <= time.time():
+                return default
+
+            # Re-insert the entry to mark it as the most recently used.
+            self._data[key] = (value, expires_at)
+
+            return value
+
+    def set(self, key, value):
+        """
+        Store the value for the given key, evicting the least recently used entries if needed.
+        """
+        expires_at = time.time() + self.timeout if self.timeout else None
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires_at)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Remove the given key from the cache.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self):
+        """
+        Return a list with the current cache keys.
+        """
+        with self._lock:
+            return list(self._data.keys())
+
+    def clear(self):
+        """
+        Remove all the entries of the cache.
+        """
+        with self._lock:
+            self._data.clear()
+
+
+COURSE_METADATA_CACHE = LRUCache(
+    max_size=getattr(settings, 'OPR_COURSE_METADATA_CACHE_SIZE', 128),
+    timeout=getattr(settings, 'OPR_COURSE_METADATA_CACHE_TIMEOUT', 3600),
+)
+
+
+def get_course_metadata(course_key):
+    """
+    Return the metadata of the course used by the reports.
+
+    The metadata is read from the course overview and kept in a per-process LRU cache for
+    OPR_COURSE_METADATA_CACHE_TIMEOUT seconds, so the report pages and the daily reports of
+    the same course don't query it again.
+
+    Args:
+        course_key: Opaque course key object.
+    Returns:
+        CourseMetadata instance, with empty values if the course does not exist.
+    """
+    course_metadata = COURSE_METADATA_CACHE.get(str(course_key))
+
+    if course_metadata is not None:
+        return course_metadata
+
+    try:
+        course_object = course_overview().get_from_id(course_key)
+    except course_overview().DoesNotExist:
+        return CourseMetadata(display_name='', start=None, intake_of_intent='')
+
+    start = course_object.start
+    course_metadata = CourseMetadata(
+        display_name=course_object.display_name or '',
+        start=start,
+        intake_of_intent='{} {}'.format(start.strftime('%B'), start.strftime('%Y')) if start else '',
+    )
+    COURSE_METADATA_CACHE.set(str(course_key), course_metadata)
+
+    return course_metadata